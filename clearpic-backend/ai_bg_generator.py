@@ -1,9 +1,11 @@
 import replicate
 import os
-import requests
 import numpy as np
 import cv2
 from dotenv import load_dotenv
+from typing import Optional, Union
+from compositing import blend_into
+from image_encoding import encode_image
 
 # ✅ Load .env values
 load_dotenv()
@@ -17,25 +19,30 @@ def get_replicate_token():
         )
     return token
 
-def generate_ai_background(prompt: str) -> str:
+# Generation settings; the model version and size are part of the background cache key
+REPLICATE_MODEL = "stability-ai/stable-diffusion:ac732df83cea7fff18b8472768c88ad041fa750ff7682a21affe81863cbe77e4"
+BACKGROUND_SIZE = 768
+
+def generate_ai_background(prompt: str, seed: Optional[int] = None) -> str:
     try:
         token = get_replicate_token()
         os.environ["REPLICATE_API_TOKEN"] = token
-        
+
+        model_input = {
+            "prompt": prompt,
+            "width": BACKGROUND_SIZE,
+            "height": BACKGROUND_SIZE,
+            "num_outputs": 1,
+            "scheduler": "K_EULER",
+            "num_inference_steps": 50,
+            "guidance_scale": 7.5,
+            "prompt_strength": 0.8
+        }
+        if seed is not None:
+            model_input["seed"] = seed
+
         # Run the model and wait for the result
-        output = replicate.run(
-            "stability-ai/stable-diffusion:ac732df83cea7fff18b8472768c88ad041fa750ff7682a21affe81863cbe77e4",
-            input={
-                "prompt": prompt,
-                "width": 768,
-                "height": 768,
-                "num_outputs": 1,
-                "scheduler": "K_EULER",
-                "num_inference_steps": 50,
-                "guidance_scale": 7.5,
-                "prompt_strength": 0.8
-            }
-        )
+        output = replicate.run(REPLICATE_MODEL, input=model_input)
         
         # The output is a list of URLs, we want the first one
         if isinstance(output, list) and len(output) > 0:
@@ -48,39 +55,36 @@ def generate_ai_background(prompt: str) -> str:
     except Exception as e:
         raise Exception(f"Failed to generate background: {str(e)}")
 
-def compose_subject_on_background(subject_path: str, background_path: str) -> str:
+def compose_subject_on_background(subject: Union[bytes, np.ndarray], background: Union[bytes, np.ndarray], mask: np.ndarray, output_format: str = "png", encode_params=None) -> bytes:
+    """Composite the subject onto `background` using `mask` (uint8, any size;
+    resized to the subject), either the U2NET matte or the upload's own
+    alpha. `subject` and `background` are encoded image bytes or already
+    decoded BGR arrays (e.g. a pre-resized cached background copy)."""
     try:
-        # Read the images
-        subject = cv2.imread(subject_path, cv2.IMREAD_UNCHANGED)
-        background = cv2.imread(background_path, cv2.IMREAD_COLOR)
+        # Decode in memory, oriented the same way as the matte
+        if isinstance(subject, (bytes, bytearray)):
+            subject = cv2.imdecode(np.frombuffer(subject, np.uint8), cv2.IMREAD_COLOR)
+        if isinstance(background, (bytes, bytearray)):
+            background = cv2.imdecode(np.frombuffer(background, np.uint8), cv2.IMREAD_COLOR)
 
         if subject is None or background is None:
             raise Exception("Failed to read input images")
 
-        # Resize background to match subject dimensions
-        background = cv2.resize(background, (subject.shape[1], subject.shape[0]))
-
-        # Get alpha channel
-        if subject.shape[2] == 4:
-            alpha = subject[:, :, 3] / 255.0
-        else:
-            # If no alpha channel, create one from the subject
-            gray = cv2.cvtColor(subject, cv2.COLOR_BGR2GRAY)
-            _, alpha = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY)
-            alpha = alpha / 255.0
+        height, width = subject.shape[:2]
+        # Resize background to match subject dimensions; copy cached arrays,
+        # since the blend below writes into the background
+        if background.shape[:2] != (height, width):
+            background = cv2.resize(background, (width, height))
+        elif not background.flags.writeable:
+            background = background.copy()
 
-        # Expand alpha to 3 channels
-        alpha = np.expand_dims(alpha, axis=-1)
-        alpha = np.repeat(alpha, 3, axis=-1)
+        # Alpha (uint8, 0-255) from the matte
+        alpha = mask if mask.shape == (height, width) else cv2.resize(mask, (width, height), interpolation=cv2.INTER_LINEAR)
 
-        # Blend
-        subject_rgb = subject[:, :, :3]
-        composite = (1 - alpha) * background + alpha * subject_rgb
-        composite = composite.astype(np.uint8)
+        # Blend in fixed point, in place into the resized background
+        composite = blend_into(background, subject, alpha)
 
-        # Save the result
-        result_path = "result.png"
-        cv2.imwrite(result_path, composite)
-        return result_path
+        # Encode the result
+        return encode_image(composite, output_format, encode_params)
     except Exception as e:
         raise Exception(f"Failed to compose image: {str(e)}")
@@ -0,0 +1,59 @@
+import hashlib
+import logging
+
+import cv2
+import numpy as np
+import requests
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ReplicateGenerator:
+    """Renders backgrounds with the same Replicate model /replace-bg uses."""
+
+    name = "replicate"
+
+    def __init__(self, timeout: float = 60.0):
+        # Imported here so the stub generator works without Replicate configured
+        from ai_bg_generator import generate_ai_background, REPLICATE_MODEL, BACKGROUND_SIZE
+        self._generate = generate_ai_background
+        self.model = REPLICATE_MODEL
+        self.size = BACKGROUND_SIZE
+        self.timeout = timeout
+
+    def generate(self, prompt: str, seed: int) -> bytes:
+        url = self._generate(prompt, seed)
+        response = requests.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+
+class GradientGenerator:
+    """Offline stand-in that draws a deterministic gradient per (prompt, seed),
+    so the library build and serving path can be exercised without API calls."""
+
+    name = "stub"
+    model = "stub-gradient"
+
+    def __init__(self, size: int = 768):
+        self.size = size
+
+    def generate(self, prompt: str, seed: int) -> bytes:
+        digest = hashlib.sha256(f"{prompt}\0{seed}".encode("utf-8")).digest()
+        start = np.frombuffer(digest[:3], np.uint8).astype(np.float32)
+        end = np.frombuffer(digest[3:6], np.uint8).astype(np.float32)
+        ramp = np.linspace(0.0, 1.0, self.size, dtype=np.float32)[:, None, None]
+        column = (start * (1.0 - ramp) + end * ramp).astype(np.uint8)
+        image = np.ascontiguousarray(np.broadcast_to(column, (self.size, self.size, 3)))
+        success, buffer = cv2.imencode(".png", image)
+        if not success:
+            raise Exception("Failed to encode gradient background")
+        return buffer.tobytes()
+
+
+GENERATORS = {
+    ReplicateGenerator.name: ReplicateGenerator,
+    GradientGenerator.name: GradientGenerator,
+}
@@ -0,0 +1,162 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import uuid
+import zipfile
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Limits for a single batch request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(200 * 1024 * 1024)))
+# Items of one batch in flight at once; capped at the inference worker count
+# so a batch never holds the queue slots single requests rely on (0 = workers)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "0"))
+# How long an item keeps retrying while the inference queue is full
+BATCH_QUEUE_WAIT_SECONDS = float(os.getenv("BATCH_QUEUE_WAIT_SECONDS", "30"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+
+# (name, result bytes or None, error message or None)
+BatchResult = Tuple[str, Optional[bytes], Optional[str]]
+
+
+def read_zip_items(archive: bytes) -> List[Tuple[str, bytes]]:
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(archive))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Uploaded archive is not a valid zip file")
+
+    entries = [
+        info for info in zf.infolist()
+        if not info.is_dir()
+        and not os.path.basename(info.filename).startswith(".")
+        and not info.filename.startswith("__MACOSX/")
+        and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+    check_batch_limits(len(entries), sum(info.file_size for info in entries))
+    return [(info.filename, zf.read(info)) for info in entries]
+
+
+def check_batch_limits(count: int, total_bytes: int):
+    if count == 0:
+        raise HTTPException(status_code=400, detail="No images found in batch")
+    if count > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch has {count} images; the limit is {BATCH_MAX_ITEMS}")
+    if total_bytes > BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_BYTES} bytes")
+
+
+def output_name(name: str, extension: str, used: set) -> str:
+    # Flatten paths and keep names unique inside the result archive
+    base = os.path.splitext(os.path.basename(name))[0] or "image"
+    candidate = f"{base}.{extension}"
+    index = 1
+    while candidate in used:
+        candidate = f"{base}_{index}.{extension}"
+        index += 1
+    used.add(candidate)
+    return candidate
+
+
+async def process_items(items: List[Tuple[str, bytes]], run: Callable, concurrency: int) -> AsyncIterator[BatchResult]:
+    """Run `run(data)` for every item with at most `concurrency` in flight and
+    yield results in completion order. Failures are yielded, not raised."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def process(name: str, data: bytes) -> BatchResult:
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + BATCH_QUEUE_WAIT_SECONDS
+            while True:
+                try:
+                    return name, await run(data), None
+                except HTTPException as e:
+                    # Inference queue full: back off and retry instead of failing the item
+                    if e.status_code == 503 and loop.time() < deadline:
+                        await asyncio.sleep(0.25)
+                        continue
+                    return name, None, str(e.detail)
+                except Exception as e:
+                    logger.error(f"Batch item {name} failed: {str(e)}")
+                    return name, None, str(e)
+
+    tasks = [asyncio.create_task(process(name, data)) for name, data in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Client went away or the stream was closed early
+        for task in tasks:
+            task.cancel()
+
+
+class _StreamBuffer(io.RawIOBase):
+    # Write-only, unseekable sink so zipfile emits data descriptors and each
+    # finished entry can be flushed to the client straight away
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_zip(results: AsyncIterator[BatchResult], extension: str) -> AsyncIterator[bytes]:
+    buffer = _StreamBuffer()
+    archive = zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED)
+    used, manifest = set(), []
+
+    async for name, data, error in results:
+        if error is None:
+            entry = output_name(name, extension, used)
+            # Encoded images are already compressed; store them as-is
+            archive.writestr(entry, data)
+            manifest.append({"source": name, "result": entry, "status": "ok"})
+        else:
+            manifest.append({"source": name, "status": "error", "error": error})
+        yield buffer.drain()
+
+    archive.writestr("manifest.json", json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+    archive.close()
+    yield buffer.drain()
+
+
+def multipart_boundary() -> str:
+    return f"clearpic-{uuid.uuid4().hex}"
+
+
+async def stream_multipart(results: AsyncIterator[BatchResult], extension: str, media_type: str, boundary: str) -> AsyncIterator[bytes]:
+    used = set()
+    async for name, data, error in results:
+        if error is None:
+            headers = (
+                f"Content-Type: {media_type}\r\n"
+                f'Content-Disposition: attachment; filename="{output_name(name, extension, used)}"\r\n'
+                f"X-Source-Filename: {name}\r\n"
+            )
+            body = data
+        else:
+            headers = (
+                "Content-Type: application/json\r\n"
+                f'Content-Disposition: attachment; filename="{output_name(name, "error.json", used)}"\r\n'
+                f"X-Source-Filename: {name}\r\n"
+            )
+            body = json.dumps({"source": name, "error": error}).encode("utf-8")
+        yield f"--{boundary}\r\n{headers}\r\n".encode("utf-8") + body + b"\r\n"
+    yield f"--{boundary}--\r\n".encode("utf-8")
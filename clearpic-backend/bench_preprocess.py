@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+from torchvision import transforms
+
+# Add the current directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from u2net_infer import to_input_tensor
+
+NORMALIZE = transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+
+# The original remove_background order: full-resolution float tensor, then resize
+LEGACY = transforms.Compose([transforms.ToTensor(), transforms.Resize((320, 320)), NORMALIZE])
+# torchvision with the resize moved ahead of ToTensor
+TORCHVISION = transforms.Compose([transforms.Resize((320, 320)), transforms.ToTensor(), NORMALIZE])
+
+
+def legacy(image):
+    return LEGACY(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+
+
+def torchvision_resize_first(image):
+    return TORCHVISION(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+
+
+def fused(image, buffer):
+    return to_input_tensor(image, out=buffer)
+
+
+def bench(fn, runs):
+    fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark U2NET input preprocessing")
+    parser.add_argument("--image", help="Image to preprocess (defaults to a synthetic frame)")
+    parser.add_argument("--size", default="4000x3000", help="Synthetic frame size as WIDTHxHEIGHT")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.image:
+        image = cv2.imread(args.image)
+    else:
+        width, height = (int(v) for v in args.size.split("x"))
+        image = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+
+    buffer = np.empty((3, 320, 320), dtype=np.float32)
+    print(f"Input {image.shape[1]}x{image.shape[0]}, median of {args.runs} runs")
+    for name, fn in [
+        ("ToTensor -> Resize (legacy)", lambda: legacy(image)),
+        ("Resize -> ToTensor (torchvision)", lambda: torchvision_resize_first(image)),
+        ("uint8 resize + fused normalize", lambda: fused(image, buffer)),
+    ]:
+        print(f"{name:34s} {bench(fn, args.runs):8.1f} ms")
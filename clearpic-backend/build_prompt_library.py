@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+# Add the current directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from background_generators import GENERATORS
+from prompt_categories import PROMPT_CATEGORIES, normalize_prompt
+from services.prompt_library import INDEX_FILE
+
+
+def slugify(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def load_index(output: str) -> dict:
+    try:
+        with open(os.path.join(output, INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_index(output: str, index: dict):
+    # Write then rename so the server never reads a partial index
+    path = os.path.join(output, INDEX_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def build(generator, output: str, categories, variants: int, force: bool = False) -> dict:
+    """Render `variants` seeds of every prompt in `categories` into `output`.
+
+    Files that already exist for the same generator model are kept unless
+    `force` is set, so an interrupted build can simply be re-run."""
+    previous = load_index(output)
+    same_model = previous.get("model") == generator.model
+    reuse = same_model and not force
+    index = {
+        "generator": generator.name,
+        "model": generator.model,
+        "size": generator.size,
+        "built_at": time.time(),
+        # Categories not rebuilt this time stay in the index
+        "prompts": dict(previous.get("prompts", {})) if same_model else {},
+    }
+
+    for category in categories:
+        os.makedirs(os.path.join(output, category), exist_ok=True)
+        for prompt in PROMPT_CATEGORIES[category]:
+            entry = {"prompt": prompt, "category": category, "variants": []}
+            for seed in range(variants):
+                relative = f"{category}/{slugify(prompt)}-{seed}.png"
+                path = os.path.join(output, relative)
+                if reuse and os.path.exists(path):
+                    print(f"⏭️  {relative} (exists)")
+                else:
+                    start = time.perf_counter()
+                    data = generator.generate(prompt, seed)
+                    with open(f"{path}.tmp", "wb") as f:
+                        f.write(data)
+                    os.replace(f"{path}.tmp", path)
+                    print(f"✅ {relative} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+                entry["variants"].append({"file": relative, "seed": seed})
+            index["prompts"][normalize_prompt(prompt)] = entry
+        # Keep the index usable after every category in case the build stops
+        write_index(output, index)
+
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render backgrounds for the curated prompt categories")
+    parser.add_argument("--generator", choices=list(GENERATORS), default="replicate")
+    parser.add_argument("--output", default=os.getenv("PROMPT_LIBRARY_DIR", "prompt_library"))
+    parser.add_argument("--variants", type=int, default=3, help="Seeds rendered per prompt")
+    parser.add_argument("--categories", help="Comma-separated subset of categories (default: all)")
+    parser.add_argument("--force", action="store_true", help="Re-render files that already exist")
+    args = parser.parse_args()
+
+    categories = args.categories.split(",") if args.categories else list(PROMPT_CATEGORIES)
+    unknown = [category for category in categories if category not in PROMPT_CATEGORIES]
+    if unknown:
+        print(f"❌ Unknown categories: {', '.join(unknown)}")
+        sys.exit(1)
+
+    try:
+        generator = GENERATORS[args.generator]()
+        index = build(generator, args.output, categories, args.variants, args.force)
+    except Exception as e:
+        print(f"❌ Failed to build prompt library: {str(e)}")
+        sys.exit(1)
+
+    print(f"✅ Library written to {args.output} ({len(index['prompts'])} prompts x {args.variants} variants)")
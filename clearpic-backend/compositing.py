@@ -0,0 +1,56 @@
+import os
+from typing import Optional
+
+import cv2
+import numpy as np
+
+# Rows blended per pass; bounds the uint16 temporaries to a strip of the image
+COMPOSITE_STRIP_ROWS = int(os.getenv("COMPOSITE_STRIP_ROWS", "256"))
+
+
+def blend_into(background: np.ndarray, foreground: np.ndarray, alpha: np.ndarray, strip_rows: Optional[int] = None) -> np.ndarray:
+    """Alpha-blend `foreground` over `background` in place, in fixed point.
+
+    background, foreground: HxWx3 uint8; alpha: HxW uint8 (0 = background,
+    255 = foreground). Computes round((fg * a + bg * (255 - a)) / 255) per
+    pixel with uint16 intermediates, broadcasting alpha over the channels
+    instead of materialising a 3-channel copy. Returns `background`.
+    """
+    if background.shape != foreground.shape or background.shape[:2] != alpha.shape:
+        raise ValueError("background, foreground and alpha sizes do not match")
+
+    height, width = alpha.shape
+    strip_rows = max(1, min(strip_rows or COMPOSITE_STRIP_ROWS, height))
+    weighted = np.empty((strip_rows, width, 3), dtype=np.uint16)
+    scratch = np.empty((strip_rows, width, 3), dtype=np.uint16)
+    inverse = np.empty((strip_rows, width), dtype=np.uint8)
+
+    for top in range(0, height, strip_rows):
+        rows = min(strip_rows, height - top)
+        bg = background[top:top + rows]
+        a = alpha[top:top + rows]
+        acc = weighted[:rows]
+        tmp = scratch[:rows]
+        inv = inverse[:rows]
+
+        np.subtract(255, a, out=inv)
+        np.multiply(foreground[top:top + rows], a[:, :, None], out=acc, dtype=np.uint16)
+        np.multiply(bg, inv[:, :, None], out=tmp, dtype=np.uint16)
+        # acc <= 255 * 255, so the sum and the rounding below stay within uint16
+        np.add(acc, tmp, out=acc)
+
+        # Exact rounded division by 255: (x + 128 + ((x + 128) >> 8)) >> 8
+        np.add(acc, 128, out=acc)
+        np.right_shift(acc, 8, out=tmp)
+        np.add(acc, tmp, out=acc)
+        np.right_shift(acc, 8, out=acc)
+        np.copyto(bg, acc, casting="unsafe")
+
+    return background
+
+
+def merge_alpha(image: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+    # BGR + HxW alpha -> BGRA in one output buffer, without float conversion
+    result = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+    result[:, :, 3] = alpha
+    return result
@@ -49,6 +49,18 @@ CREATE TABLE IF NOT EXISTS subscriptions (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc'::text, NOW())
 );
 
+-- Columns used by the Stripe webhooks
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS stripe_customer_id TEXT;
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS stripe_subscription_id TEXT;
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS current_period_start BIGINT;
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS current_period_end BIGINT;
+CREATE INDEX IF NOT EXISTS profiles_stripe_customer_id_idx ON profiles (stripe_customer_id);
+CREATE INDEX IF NOT EXISTS subscriptions_stripe_subscription_id_idx ON subscriptions (stripe_subscription_id);
+
+-- Keyset pagination of a user's history, newest first (/credits/transactions)
+CREATE INDEX IF NOT EXISTS credit_transactions_user_created_idx
+    ON credit_transactions (user_id, created_at DESC, id DESC);
+
 -- Enable Row Level Security on all tables
 ALTER TABLE profiles ENABLE ROW LEVEL SECURITY;
 ALTER TABLE credit_transactions ENABLE ROW LEVEL SECURITY;
@@ -162,4 +174,100 @@ DROP TRIGGER IF EXISTS rls_bypass_trigger ON subscriptions;
 CREATE TRIGGER rls_bypass_trigger
     BEFORE INSERT OR UPDATE ON subscriptions
     FOR EACH ROW
-    EXECUTE FUNCTION handle_rls_bypass(); 
\ No newline at end of file
+    EXECUTE FUNCTION handle_rls_bypass(); 
+
+-- Atomically add to (or, with a negative amount, deduct from) a user's
+-- credits. Returns the new balance, or NULL if the user does not exist or
+-- the balance would go negative.
+CREATE OR REPLACE FUNCTION adjust_credits(p_user_id UUID, p_amount INTEGER)
+RETURNS INTEGER AS $$
+    UPDATE profiles
+    SET credits = credits + p_amount,
+        updated_at = TIMEZONE('utc'::text, NOW())
+    WHERE id = p_user_id AND credits + p_amount >= 0
+    RETURNING credits;
+$$ LANGUAGE sql SECURITY DEFINER;
+
+REVOKE EXECUTE ON FUNCTION adjust_credits(UUID, INTEGER) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION adjust_credits(UUID, INTEGER) TO service_role;
+
+-- Apply a batch of journaled credit transactions (see services/credit_ledger.py)
+-- in one transaction. Rows whose id already exists are skipped, so a batch
+-- can be replayed safely. Returns the new balance of each affected user.
+CREATE OR REPLACE FUNCTION apply_credit_transactions(p_entries JSONB)
+RETURNS TABLE (user_id UUID, credits INTEGER) AS $$
+    WITH inserted AS (
+        INSERT INTO credit_transactions (id, user_id, amount, type, description, created_at)
+        SELECT e.id, e.user_id, e.amount, e.type, e.description, e.created_at
+        FROM jsonb_to_recordset(p_entries)
+            AS e(id UUID, user_id UUID, amount INTEGER, type TEXT, description TEXT, created_at TIMESTAMP WITH TIME ZONE)
+        ON CONFLICT (id) DO NOTHING
+        RETURNING credit_transactions.user_id, credit_transactions.amount
+    ), totals AS (
+        SELECT inserted.user_id, SUM(inserted.amount) AS amount
+        FROM inserted
+        GROUP BY inserted.user_id
+    )
+    UPDATE profiles
+    SET credits = profiles.credits + totals.amount,
+        updated_at = TIMEZONE('utc'::text, NOW())
+    FROM totals
+    WHERE profiles.id = totals.user_id
+    RETURNING profiles.id, profiles.credits;
+$$ LANGUAGE sql SECURITY DEFINER;
+
+REVOKE EXECUTE ON FUNCTION apply_credit_transactions(JSONB) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION apply_credit_transactions(JSONB) TO service_role;
+
+-- Optional: per-user running totals of credit_transactions, kept by a
+-- trigger so reconciling a balance against its history never scans it.
+-- profiles.credits stays the balance the API reads and enforces.
+CREATE TABLE IF NOT EXISTS credit_balances (
+    user_id UUID PRIMARY KEY REFERENCES auth.users(id) ON DELETE CASCADE,
+    balance INTEGER NOT NULL DEFAULT 0,
+    transaction_count INTEGER NOT NULL DEFAULT 0,
+    last_transaction_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc'::text, NOW())
+);
+
+ALTER TABLE credit_balances ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own credit balance" ON credit_balances;
+CREATE POLICY "Users can view own credit balance"
+    ON credit_balances FOR SELECT
+    USING (auth.uid() = user_id);
+
+GRANT SELECT ON credit_balances TO authenticated;
+GRANT ALL ON credit_balances TO service_role;
+
+CREATE OR REPLACE FUNCTION handle_credit_transaction()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO credit_balances (user_id, balance, transaction_count, last_transaction_at)
+    VALUES (NEW.user_id, NEW.amount, 1, NEW.created_at)
+    ON CONFLICT (user_id) DO UPDATE
+    SET balance = credit_balances.balance + EXCLUDED.balance,
+        transaction_count = credit_balances.transaction_count + 1,
+        last_transaction_at = GREATEST(credit_balances.last_transaction_at, EXCLUDED.last_transaction_at),
+        updated_at = TIMEZONE('utc'::text, NOW());
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS on_credit_transaction_created ON credit_transactions;
+CREATE TRIGGER on_credit_transaction_created
+    AFTER INSERT ON credit_transactions
+    FOR EACH ROW
+    EXECUTE FUNCTION handle_credit_transaction();
+
+-- Backfill totals for history written before the trigger existed
+INSERT INTO credit_balances (user_id, balance, transaction_count, last_transaction_at)
+SELECT user_id, SUM(amount), COUNT(*), MAX(created_at)
+FROM credit_transactions
+WHERE user_id IS NOT NULL
+GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE
+SET balance = EXCLUDED.balance,
+    transaction_count = EXCLUDED.transaction_count,
+    last_transaction_at = EXCLUDED.last_transaction_at,
+    updated_at = TIMEZONE('utc'::text, NOW());
@@ -0,0 +1,100 @@
+import argparse
+import inspect
+import os
+import sys
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+# Add the current directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from model.u2net import U2NET, U2NETP
+from u2net_infer import MODEL_VARIANTS, load_checkpoint, OnnxRuntimeBackend
+
+EXPORT_MODELS = {
+    "u2net": U2NET,
+    "u2netp": U2NETP,
+}
+
+
+class FusedOutput(nn.Module):
+    # Export only the fused saliency map the service uses; the side outputs
+    # are then pruned from the graph
+    def __init__(self, net):
+        super(FusedOutput, self).__init__()
+        self.net = net
+
+    def forward(self, x):
+        return self.net(x)[0]
+
+
+def export(variant: str, checkpoint: str, output: str, opset: int = 17) -> nn.Module:
+    net = load_checkpoint(EXPORT_MODELS[variant](3, 1), checkpoint)
+    # The exporter restores the wrapper's training flag on the whole tree
+    # afterwards, so the wrapper itself must be in eval mode too
+    wrapper = FusedOutput(net).eval()
+
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # The TorchScript-based exporter handles U2NET's shape-driven upsampling
+        kwargs["dynamo"] = False
+
+    torch.onnx.export(
+        wrapper,
+        torch.zeros(1, 3, 320, 320),
+        output,
+        input_names=["input"],
+        output_names=["d1"],
+        dynamic_axes={"input": {0: "batch"}, "d1": {0: "batch"}},
+        opset_version=opset,
+        **kwargs
+    )
+    return net
+
+
+def verify_parity(net: nn.Module, onnx_path: str, batch_size: int = 2, atol: float = 1e-4) -> float:
+    # Compare ONNX Runtime against eager PyTorch on a random batch; a batch > 1
+    # also checks that the batch axis really is dynamic
+    inputs = torch.randn(batch_size, 3, 320, 320)
+    with torch.no_grad():
+        expected = net(inputs)[0]
+    actual = OnnxRuntimeBackend(onnx_path).run(inputs)
+
+    if actual.shape != expected.shape:
+        raise Exception(f"Shape mismatch: onnx {tuple(actual.shape)} vs torch {tuple(expected.shape)}")
+    max_diff = float(np.abs(actual.numpy() - expected.numpy()).max())
+    if max_diff > atol:
+        raise Exception(f"Max abs difference {max_diff:.2e} exceeds tolerance {atol:.0e}")
+    return max_diff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export U2NET / U2NETP to ONNX with a dynamic batch axis")
+    parser.add_argument("--variant", choices=list(EXPORT_MODELS), default="u2net")
+    parser.add_argument("--checkpoint", help="Source .pth checkpoint (defaults to the variant's configured path)")
+    parser.add_argument("--output", help="Destination .onnx file (defaults to the variant's configured path)")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--skip-verify", action="store_true", help="Skip the ONNX Runtime vs PyTorch parity check")
+    args = parser.parse_args()
+
+    _, default_checkpoint, default_output = MODEL_VARIANTS[args.variant]
+    checkpoint = args.checkpoint or default_checkpoint
+    output = args.output or default_output
+
+    try:
+        net = export(args.variant, checkpoint, output, args.opset)
+        print(f"✅ Exported {args.variant} to {output}")
+    except Exception as e:
+        print(f"❌ Failed to export {args.variant}: {str(e)}")
+        sys.exit(1)
+
+    if not args.skip_verify:
+        try:
+            max_diff = verify_parity(net, output)
+            print(f"✅ ONNX Runtime output matches PyTorch (max abs diff {max_diff:.2e})")
+        except Exception as e:
+            print(f"❌ Parity check failed: {str(e)}")
+            sys.exit(1)
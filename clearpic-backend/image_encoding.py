@@ -0,0 +1,133 @@
+import json
+import os
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+# Output formats we can encode, and their media types
+OUTPUT_FORMATS = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+FORMAT_ALIASES = {"jpg": "jpeg"}
+
+# Mask-only encodings, and their media types
+MASK_FORMATS = {
+    # 8-bit grayscale PNG of the soft matte
+    "png": "image/png",
+    # 1 bit per pixel (bilevel) PNG of the matte thresholded at `threshold`
+    "binary": "image/png",
+    # Run-length encoded thresholded matte as JSON
+    "rle": "application/json",
+}
+
+# zlib level 0-9; lower is faster with larger files
+PNG_COMPRESSION_LEVEL = int(os.getenv("PNG_COMPRESSION_LEVEL", "3"))
+# Quality for lossy WebP / JPEG, 1-100
+LOSSY_QUALITY = int(os.getenv("LOSSY_QUALITY", "90"))
+
+
+def negotiate_format(requested: Optional[str] = None, accept: Optional[str] = None, has_alpha: bool = True) -> str:
+    """Pick an output format from an explicit `format=` value or the Accept header.
+
+    An explicit format wins and is validated; JPEG is rejected when the result
+    carries transparency. Otherwise the highest-q supported type in Accept is
+    used, skipping JPEG for transparent results, and PNG is the default.
+    """
+    if requested:
+        fmt = FORMAT_ALIASES.get(requested.lower(), requested.lower())
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported format '{requested}'. Expected one of: {', '.join(OUTPUT_FORMATS)}")
+        if fmt == "jpeg" and has_alpha:
+            raise ValueError("JPEG cannot carry transparency; use png or webp")
+        return fmt
+
+    candidates = []
+    for position, part in enumerate((accept or "").split(",")):
+        media_type, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        candidates.append((-q, position, media_type.strip().lower()))
+
+    for neg_q, _, media_type in sorted(candidates):
+        if neg_q >= 0:
+            break
+        for fmt, fmt_media_type in OUTPUT_FORMATS.items():
+            if media_type == fmt_media_type and not (fmt == "jpeg" and has_alpha):
+                return fmt
+    return "png"
+
+
+def encode_params(fmt: str = "png", quality: Optional[int] = None, lossless: bool = False, compression: Optional[int] = None) -> List[int]:
+    """Validate encoder options and turn them into cv2.imencode parameters.
+
+    quality: 1-100 for lossy WebP and JPEG; lossless: WebP lossless mode;
+    compression: PNG zlib level 0-9.
+    """
+    if fmt == "png":
+        level = PNG_COMPRESSION_LEVEL if compression is None else compression
+        if not 0 <= level <= 9:
+            raise ValueError("PNG compression must be between 0 and 9")
+        return [cv2.IMWRITE_PNG_COMPRESSION, level]
+    if fmt == "webp":
+        # libwebp treats quality > 100 as lossless
+        return [cv2.IMWRITE_WEBP_QUALITY, 101 if lossless else _lossy_quality(quality)]
+    if fmt == "jpeg":
+        return [cv2.IMWRITE_JPEG_QUALITY, _lossy_quality(quality)]
+    raise ValueError(f"Unsupported format '{fmt}'")
+
+
+def encode_image(image: np.ndarray, fmt: str = "png", params: Optional[List[int]] = None) -> bytes:
+    # Encode a BGR/BGRA uint8 image; JPEG drops any alpha channel
+    if params is None:
+        params = encode_params(fmt)
+    if fmt == "jpeg" and image.ndim == 3 and image.shape[2] == 4:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+
+    success, buffer = cv2.imencode(f".{fmt}", image, params)
+    if not success:
+        raise Exception(f"Failed to encode result image as {fmt}")
+    return buffer.tobytes()
+
+
+def encode_mask(mask: np.ndarray, mask_format: str = "png", threshold: int = 128) -> bytes:
+    """Encode an HxW uint8 matte in one of MASK_FORMATS.
+
+    The rle form is {"size": [h, w], "threshold": t, "counts": [...]}: run
+    lengths over the row-major thresholded mask, alternating background and
+    foreground and always starting with a (possibly empty) background run.
+    """
+    if mask_format == "png":
+        success, buffer = cv2.imencode(".png", mask, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION_LEVEL])
+    elif mask_format == "binary":
+        bilevel = np.where(mask >= threshold, 255, 0).astype(np.uint8)
+        success, buffer = cv2.imencode(".png", bilevel, [cv2.IMWRITE_PNG_BILEVEL, 1])
+    elif mask_format == "rle":
+        flat = (mask >= threshold).ravel()
+        boundaries = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+        counts = np.diff(np.concatenate(([0], boundaries, [flat.size])))
+        if flat.size and flat[0]:
+            counts = np.concatenate(([0], counts))
+        payload = {"size": [int(mask.shape[0]), int(mask.shape[1])], "threshold": threshold, "counts": counts.tolist()}
+        return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    else:
+        raise ValueError(f"Unsupported mask format '{mask_format}'. Expected one of: {', '.join(MASK_FORMATS)}")
+
+    if not success:
+        raise Exception(f"Failed to encode mask as {mask_format}")
+    return buffer.tobytes()
+
+
+def _lossy_quality(quality: Optional[int]) -> int:
+    quality = LOSSY_QUALITY if quality is None else quality
+    if not 1 <= quality <= 100:
+        raise ValueError("Output quality must be between 1 and 100")
+    return quality
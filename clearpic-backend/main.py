@@ -1,15 +1,22 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
-from fastapi.responses import Response, JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, Depends
+from fastapi.responses import Response, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from u2net_infer import remove_background
-from ai_bg_generator import generate_ai_background, compose_subject_on_background
-from openai_service import analyze_image, get_suggested_prompts, get_category_prompts, PROMPT_CATEGORIES, rewrite_prompt
-import requests
-import os
-import json
+from u2net_infer import remove_background, extract_mask, resolve_quality, PRELOAD_VARIANTS
+from image_encoding import negotiate_format, encode_params, OUTPUT_FORMATS, MASK_FORMATS
+from pipelines import replace_background_pipeline
+from prompt_suggestions import prepare_for_analysis, suggest_prompts
+from batch_processing import read_zip_items, check_batch_limits, process_items, stream_zip, stream_multipart, multipart_boundary, BATCH_CONCURRENCY
+from openai_service import get_category_prompts, PROMPT_CATEGORIES, rewrite_prompt, close_client as close_openai_client
+import asyncio
 import logging
-from typing import List, Dict
-from routes import webhooks, auth, credits, subscription
+from typing import List, Dict, Optional
+from routes import webhooks, auth, credits, subscription, jobs
+from middleware.auth import get_user_plan
+from services.model_registry import model_registry
+from services.inference_executor import inference_executor
+from services.job_runner import job_runner
+from services.credit_ledger import credit_ledger
+from services.http_client import http_client
 
 # Set up logging
 logging.basicConfig(
@@ -34,6 +41,31 @@ app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(credits.router, prefix="/credits", tags=["credits"])
 app.include_router(subscription.router, prefix="/subscription", tags=["subscription"])
 app.include_router(webhooks.router, prefix="/webhooks", tags=["webhooks"])
+app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+
+@app.on_event("startup")
+async def preload_models():
+    # Load and warm every registered model variant in the background;
+    # /health/ready reports 503 until they are all ready
+    asyncio.get_running_loop().run_in_executor(None, model_registry.preload, PRELOAD_VARIANTS)
+
+@app.on_event("startup")
+async def start_job_runner():
+    # Also resumes jobs left unfinished by a previous process
+    await job_runner.start()
+
+@app.on_event("startup")
+async def start_credit_ledger():
+    # Also queues credit transactions journaled but not flushed by a previous process
+    await credit_ledger.start()
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    await job_runner.stop()
+    await credit_ledger.stop()
+    await http_client.close()
+    await close_openai_client()
+    inference_executor.shutdown()
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -47,77 +79,166 @@ async def global_exception_handler(request: Request, exc: Exception):
 async def root():
     return {"message": "Welcome to ClearPic API"}
 
+@app.get("/health/ready")
+async def readiness():
+    status = model_registry.status()
+    if not model_registry.is_ready(PRELOAD_VARIANTS):
+        return JSONResponse(status_code=503, content={"ready": False, "models": status})
+    return {"ready": True, "models": status}
+
+def image_response(data: bytes, output_format: str, headers: Optional[Dict[str, str]] = None):
+    # The encoders produce the whole image at once, so send it with a Content-Length
+    headers = {"Vary": "Accept", **(headers or {})}
+    return Response(content=data, media_type=OUTPUT_FORMATS[output_format], headers=headers)
+
 # Basic background removal
 @app.post("/remove-bg")
-async def remove_bg(file: UploadFile = File(...)):
+async def remove_bg(
+    request: Request,
+    file: UploadFile = File(...),
+    quality: Optional[str] = Form(None),
+    format: Optional[str] = Form(None),
+    output_quality: Optional[int] = Form(None),
+    lossless: bool = Form(False),
+    compression: Optional[int] = Form(None),
+    plan: Optional[str] = Depends(get_user_plan)
+):
+    try:
+        try:
+            quality = resolve_quality(quality, plan)
+            output_format = negotiate_format(format, request.headers.get("accept"), has_alpha=True)
+            params = encode_params(output_format, output_quality, lossless, compression)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        content = await file.read()
+
+        # Remove background in memory, off the event loop
+        result_data = await inference_executor.run(remove_background, content, quality, output_format, params)
+
+        return image_response(result_data, output_format, headers={"X-Model-Quality": quality})
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Background removal for many images in one request
+@app.post("/remove-bg/batch")
+async def remove_bg_batch(
+    request: Request,
+    files: List[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    quality: Optional[str] = Form(None),
+    format: Optional[str] = Form(None),
+    output_quality: Optional[int] = Form(None),
+    lossless: bool = Form(False),
+    compression: Optional[int] = Form(None),
+    output: str = Form("zip"),
+    plan: Optional[str] = Depends(get_user_plan)
+):
+    try:
+        quality = resolve_quality(quality, plan)
+        output_format = negotiate_format(format, request.headers.get("accept"), has_alpha=True)
+        params = encode_params(output_format, output_quality, lossless, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if output not in ("zip", "multipart"):
+        raise HTTPException(status_code=400, detail="Invalid output. Expected 'zip' or 'multipart'")
+    if bool(files) == bool(archive):
+        raise HTTPException(status_code=400, detail="Upload either files or a single zip archive")
+
+    if archive:
+        items = read_zip_items(await archive.read())
+    else:
+        items = [(upload.filename or f"image_{index}", await upload.read()) for index, upload in enumerate(files)]
+        check_batch_limits(len(items), sum(len(data) for _, data in items))
+
+    # Items run concurrently so the batching engine can group them into
+    # shared forward passes; results stream out as each one finishes
+    async def run(data: bytes) -> bytes:
+        return await inference_executor.run(remove_background, data, quality, output_format, params)
+
+    workers = inference_executor.max_workers
+    results = process_items(items, run, concurrency=min(BATCH_CONCURRENCY or workers, workers))
+    headers = {"Vary": "Accept", "X-Model-Quality": quality, "X-Batch-Size": str(len(items))}
+
+    if output == "multipart":
+        boundary = multipart_boundary()
+        return StreamingResponse(
+            stream_multipart(results, output_format, OUTPUT_FORMATS[output_format], boundary),
+            media_type=f"multipart/mixed; boundary={boundary}",
+            headers=headers
+        )
+    headers["Content-Disposition"] = 'attachment; filename="clearpic-batch.zip"'
+    return StreamingResponse(stream_zip(results, output_format), media_type="application/zip", headers=headers)
+
+# Alpha matte only, for clients that composite locally
+@app.post("/mask")
+async def get_mask(
+    file: UploadFile = File(...),
+    quality: Optional[str] = Form(None),
+    format: str = Form("png"),
+    resolution: str = Form("native"),
+    threshold: int = Form(128),
+    plan: Optional[str] = Depends(get_user_plan)
+):
     try:
-        # Save the uploaded file
-        file_path = "temp_input.png"
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Remove background
-        result_path = remove_background(file_path)
-        
-        # Read the result and return it
-        with open(result_path, "rb") as f:
-            result_data = f.read()
-        
-        # Clean up temporary files
-        os.remove(file_path)
-        os.remove(result_path)
-        
-        return Response(content=result_data, media_type="image/png")
-        
+        try:
+            quality = resolve_quality(quality, plan)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if format not in MASK_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Invalid format '{format}'. Expected one of: {', '.join(MASK_FORMATS)}")
+        if resolution not in ("native", "source"):
+            raise HTTPException(status_code=400, detail="Invalid resolution. Expected 'native' or 'source'")
+        if not 1 <= threshold <= 255:
+            raise HTTPException(status_code=400, detail="Threshold must be between 1 and 255")
+
+        content = await file.read()
+        result_data = await inference_executor.run(extract_mask, content, quality, resolution, format, threshold)
+
+        return Response(content=result_data, media_type=MASK_FORMATS[format], headers={"X-Model-Quality": quality})
+
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up temporary files if they exist
-        if os.path.exists("temp_input.png"):
-            os.remove("temp_input.png")
-        if os.path.exists("result_removed_bg.png"):
-            os.remove("result_removed_bg.png")
+        logger.error(f"Error in get_mask: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # AI background replacement
 @app.post("/replace-bg")
-async def replace_bg(file: UploadFile = File(...), prompt: str = Form(...)):
+async def replace_bg(
+    request: Request,
+    file: UploadFile = File(...),
+    prompt: str = Form(...),
+    quality: Optional[str] = Form(None),
+    format: Optional[str] = Form(None),
+    output_quality: Optional[int] = Form(None),
+    lossless: bool = Form(False),
+    compression: Optional[int] = Form(None),
+    seed: Optional[int] = Form(None),
+    plan: Optional[str] = Depends(get_user_plan)
+):
     try:
-        # Save the uploaded file temporarily
-        temp_path = f"temp_{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Generate new background
-        bg_url = generate_ai_background(prompt)
-        
-        # Download the background image
-        bg_response = requests.get(bg_url)
-        bg_path = "temp_bg.png"
-        with open(bg_path, "wb") as f:
-            f.write(bg_response.content)
-        
-        # Compose the image
-        result_path = compose_subject_on_background(temp_path, bg_path)
-        
-        # Read the result
-        with open(result_path, "rb") as f:
-            result_data = f.read()
-        
-        # Clean up temporary files
-        os.remove(temp_path)
-        os.remove(bg_path)
-        os.remove(result_path)
-        
-        return Response(content=result_data, media_type="image/png")
+        try:
+            quality = resolve_quality(quality, plan)
+            # The composite is opaque, so JPEG is allowed here
+            output_format = negotiate_format(format, request.headers.get("accept"), has_alpha=False)
+            params = encode_params(output_format, output_quality, lossless, compression)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        content = await file.read()
+
+        # Long generations can outlive proxy timeouts; POST /jobs/replace-bg runs
+        # the same pipeline in the background
+        result_data = await replace_background_pipeline(content, prompt, output_format, params, seed=seed, quality=quality)
+
+        return image_response(result_data, output_format, headers={"X-Model-Quality": quality})
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up temporary files if they exist
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        if os.path.exists(bg_path):
-            os.remove(bg_path)
-        if os.path.exists(result_path):
-            os.remove(result_path)
         logger.error(f"Error in replace_bg: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -132,6 +253,20 @@ async def rewrite_prompt_api(prompt: str = Form(...)):
         logger.error(f"Error in rewrite_prompt_api: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/suggest-prompts")
+async def suggest_prompts_api(file: UploadFile = File(...)):
+    try:
+        content = await file.read()
+        # Downscale to a small JPEG and hash it, off the event loop
+        jpeg, image_hash = await inference_executor.run(prepare_for_analysis, content)
+        result, cached = await suggest_prompts(jpeg, image_hash)
+        return {"prompts": result["prompts"], "analysis": result["analysis"], "cached": cached}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in suggest_prompts_api: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/prompts/{category}")
 async def get_prompts(category: str):
     try:
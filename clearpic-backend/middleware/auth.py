@@ -1,10 +1,14 @@
-from fastapi import HTTPException, Request
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import create_client, Client
+import asyncio
 import os
 import logging
 from typing import Optional
+from models.user import AuthenticatedUser
 from services.supabase_service import supabase_service
+from services.token_verifier import token_verifier, TokenError
+from services.credit_ledger import credit_ledger, InsufficientCredits
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -28,27 +32,49 @@ except Exception as e:
     raise
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
-async def verify_token(request: Request, credentials: HTTPAuthorizationCredentials = security) -> Optional[dict]:
+async def remote_get_user(token: str) -> AuthenticatedUser:
+    # Supabase round trip; only used when a token can't be verified locally
+    response = await asyncio.get_running_loop().run_in_executor(None, supabase.auth.get_user, token)
+    user = getattr(response, "user", None)
+    if not user:
+        raise TokenError("Invalid token")
+    return AuthenticatedUser(id=user.id, email=user.email, role=user.role)
+
+token_verifier.remote_lookup = remote_get_user
+
+async def verify_token(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)) -> AuthenticatedUser:
     try:
-        token = credentials.credentials
-        user = supabase.auth.get_user(token)
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return user
+        return await token_verifier.verify(credentials.credentials)
     except Exception as e:
         logger.error(f"Token verification error: {str(e)}")
-        raise HTTPException(status_code=401, detail="Invalid token")
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+
+async def get_user_plan(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)) -> Optional[str]:
+    # Anonymous or unverifiable requests have no plan and get the default tier
+    if not credentials:
+        return None
+    try:
+        user = await token_verifier.verify(credentials.credentials)
+        profile = await supabase_service.get_user_profile(user.id)
+        return profile.get("subscription_status") if profile else None
+    except Exception as e:
+        logger.warning(f"Could not resolve user plan: {str(e)}")
+        return None
 
 async def check_credits(user_id: str):
     try:
-        profile = await supabase_service.get_user_profile(user_id)
-        if not profile or profile.get("credits", 0) <= 0:
+        if await credit_ledger.available(user_id) <= 0:
             raise HTTPException(
                 status_code=402,
                 detail="Insufficient credits"
             )
         return True
+    except HTTPException:
+        raise
+    except InsufficientCredits:
+        raise HTTPException(status_code=402, detail="Insufficient credits")
     except Exception as e:
         logger.error(f"Error checking credits: {str(e)}")
         raise HTTPException(
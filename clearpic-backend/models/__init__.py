@@ -1,5 +1,5 @@
 from .credit import CreditPurchase, CreditTransaction, CreditBalance
-from .user import UserProfile, UserCreate, UserUpdate
+from .user import UserProfile, UserCreate, UserUpdate, AuthenticatedUser
 
 __all__ = [
     'CreditPurchase',
@@ -7,5 +7,6 @@ __all__ = [
     'CreditBalance',
     'UserProfile',
     'UserCreate',
-    'UserUpdate'
+    'UserUpdate',
+    'AuthenticatedUser'
 ] 
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Dict, Optional
 from datetime import datetime
 
 class UserProfile(BaseModel):
@@ -21,3 +21,11 @@ class UserCreate(BaseModel):
 class UserUpdate(BaseModel):
     full_name: Optional[str]
     avatar_url: Optional[str]
+
+class AuthenticatedUser(BaseModel):
+    # The caller identified by a verified access token
+    id: str
+    email: Optional[str] = None
+    role: Optional[str] = None
+    expires_at: Optional[int] = None
+    claims: Dict[str, Any] = {}
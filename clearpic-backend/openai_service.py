@@ -1,9 +1,12 @@
 import os
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import base64
 import logging
 from typing import List, Dict
+from prompt_categories import PROMPT_CATEGORIES, normalize_prompt
+from utils.ttl_cache import TTLCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -17,49 +20,41 @@ if not os.getenv('OPENAI_API_KEY'):
     logger.error("OPENAI_API_KEY not found in environment variables")
     raise ValueError("OPENAI_API_KEY not found in environment variables")
 
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
-# Predefined prompt categories
-PROMPT_CATEGORIES = {
-    'nature': [
-        'Serene mountain landscape with a lake',
-        'Tropical beach paradise',
-        'Misty forest with morning light',
-        'Autumn forest with colorful leaves',
-        'Snowy winter wonderland'
-    ],
-    'urban': [
-        'Modern city skyline at sunset',
-        'Cozy cafe interior',
-        'Neon-lit city streets',
-        'Historic European street',
-        'Modern office space'
-    ],
-    'abstract': [
-        'Geometric patterns with vibrant colors',
-        'Abstract fluid art',
-        'Minimalist design with negative space',
-        'Futuristic digital art',
-        'Abstract nature-inspired patterns'
-    ],
-    'fantasy': [
-        'Magical forest with glowing elements',
-        'Floating islands in the sky',
-        'Crystal cave with magical light',
-        'Enchanted garden with fairies',
-        'Mystical portal in ancient ruins'
-    ]
-}
-
-async def analyze_image(image_path: str) -> Dict:
-    """Analyze the image using OpenAI's Vision API and return relevant information."""
+# Per-call timeouts in seconds; vision requests upload an image and take longest
+ANALYZE_TIMEOUT = float(os.getenv("OPENAI_ANALYZE_TIMEOUT_SECONDS", "45"))
+SUGGEST_TIMEOUT = float(os.getenv("OPENAI_SUGGEST_TIMEOUT_SECONDS", "30"))
+REWRITE_TIMEOUT = float(os.getenv("OPENAI_REWRITE_TIMEOUT_SECONDS", "20"))
+
+# Async client over one pooled connection set, so calls don't block the event loop
+client = AsyncOpenAI(
+    api_key=os.getenv('OPENAI_API_KEY'),
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+        ),
+        timeout=httpx.Timeout(REWRITE_TIMEOUT, connect=5.0)
+    )
+)
+
+# Rewrites keyed by normalized prompt; popular prompts are rewritten many times a day
+rewrite_cache = TTLCache(
+    max_entries=int(os.getenv("REWRITE_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=float(os.getenv("REWRITE_CACHE_TTL_SECONDS", str(24 * 3600)))
+)
+
+async def close_client():
+    await client.close()
+
+async def analyze_image(image_data: bytes) -> Dict:
+    """Analyze the image using OpenAI's Vision API and return relevant information.
+    `image_data` should already be a small JPEG (see prompt_suggestions)."""
     try:
-        logger.info(f"Reading image file: {image_path}")
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+        base64_image = base64.b64encode(image_data).decode('utf-8')
 
         logger.info("Sending request to OpenAI Vision API")
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4-vision-preview-1106",
             messages=[
                 {
@@ -72,13 +67,15 @@ async def analyze_image(image_path: str) -> Dict:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
+                                "url": f"data:image/jpeg;base64,{base64_image}",
+                                "detail": "low"
                             }
                         }
                     ]
                 }
             ],
-            max_tokens=300
+            max_tokens=300,
+            timeout=ANALYZE_TIMEOUT
         )
 
         logger.info("Received response from OpenAI Vision API")
@@ -91,7 +88,7 @@ async def get_suggested_prompts(image_analysis: Dict) -> List[str]:
     """Generate suggested prompts based on image analysis."""
     try:
         logger.info("Sending request to OpenAI for prompt generation")
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4-1106-preview",
             messages=[
                 {
@@ -103,7 +100,8 @@ async def get_suggested_prompts(image_analysis: Dict) -> List[str]:
                     "content": f"Based on this image analysis: {image_analysis}, suggest 5 creative background prompts that would work well with this image. Format as a JSON array of strings."
                 }
             ],
-            max_tokens=300
+            max_tokens=300,
+            timeout=SUGGEST_TIMEOUT
         )
 
         logger.info("Received response from OpenAI for prompt generation")
@@ -124,10 +122,15 @@ def get_category_prompts(category: str) -> List[str]:
         return []
 
 async def rewrite_prompt(prompt: str) -> str:
-    """Rewrite or improve a user prompt for background replacement using OpenAI."""
+    """Rewrite or improve a user prompt for background replacement using OpenAI.
+    Results are cached by normalized prompt; concurrent identical rewrites
+    share one upstream call."""
+    return await rewrite_cache.get_or_set(normalize_prompt(prompt), lambda: _rewrite_prompt(prompt))
+
+async def _rewrite_prompt(prompt: str) -> str:
     try:
         logger.info(f"Rewriting prompt: {prompt}")
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4-1106-preview",
             messages=[
                 {
@@ -163,7 +166,8 @@ Format your response as a single, concise sentence optimized for background repl
                     "content": prompt
                 }
             ],
-            max_tokens=150
+            max_tokens=150,
+            timeout=REWRITE_TIMEOUT
         )
         improved_prompt = response.choices[0].message.content.strip()
         logger.info(f"Rewritten prompt: {improved_prompt}")
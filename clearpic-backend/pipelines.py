@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+from ai_bg_generator import generate_ai_background, compose_subject_on_background, REPLICATE_MODEL, BACKGROUND_SIZE
+from u2net_infer import remove_background, compute_mask, decode_with_alpha, source_size
+from services.inference_executor import inference_executor
+from services.http_client import http_client
+from services.background_cache import background_cache
+from services.prompt_library import prompt_library
+from services.job_runner import ProgressCallback
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def _report(progress: Optional[ProgressCallback], stage: str, percent: int):
+    if progress is not None:
+        await progress(stage, percent)
+
+
+async def remove_background_pipeline(content: bytes, quality: str, output_format: str, params: List[int], progress: Optional[ProgressCallback] = None) -> bytes:
+    await _report(progress, "segmenting", 10)
+    return await inference_executor.run(remove_background, content, quality, output_format, params)
+
+
+async def get_background(prompt: str, seed: Optional[int] = None, subject_size: Optional[Tuple[int, int]] = None, progress: Optional[ProgressCallback] = None) -> Union[bytes, np.ndarray]:
+    """Background for `prompt`: from the pre-rendered library for curated
+    prompts, else from the background cache, else freshly generated."""
+    loop = asyncio.get_running_loop()
+
+    # Curated category prompts are served from the pre-rendered library
+    background = await loop.run_in_executor(None, prompt_library.load, prompt, seed)
+    if background is not None:
+        return background
+
+    key = background_cache.key(prompt, REPLICATE_MODEL, BACKGROUND_SIZE, BACKGROUND_SIZE, seed)
+    # A copy pre-resized to the subject's size skips the background decode and resize
+    if subject_size is not None:
+        background = await loop.run_in_executor(None, background_cache.get_resized, key, *subject_size)
+        if background is not None:
+            return background
+
+    async def generate() -> bytes:
+        # Replicate's client blocks on the network, so keep it off the event loop.
+        # This may outlive the request that started it (other requests can be
+        # waiting on it), so it must not report that request's progress
+        bg_url = await loop.run_in_executor(None, generate_ai_background, prompt, seed)
+        return await http_client.fetch_bytes(bg_url)
+
+    await _report(progress, "generating", 10)
+    return await background_cache.get_or_generate(key, generate)
+
+
+async def replace_background_pipeline(content: bytes, prompt: str, output_format: str, params: List[int], progress: Optional[ProgressCallback] = None, seed: Optional[int] = None, quality: str = "full") -> bytes:
+    """Composite the upload onto a background for `prompt`.
+
+    An upload that already has transparency (e.g. the cut-out from
+    /remove-bg) is composited with its own alpha. Otherwise segmentation of
+    the subject and fetching or generating the background run concurrently,
+    so latency is roughly the slower of the two rather than their sum.
+    """
+    try:
+        subject_size = source_size(content)
+    except Exception:
+        subject_size = None
+
+    # Decode first so an unreadable upload fails before any background work starts
+    subject, mask = await inference_executor.run(decode_with_alpha, content)
+
+    await _report(progress, "segmenting", 5)
+    tasks = [asyncio.ensure_future(get_background(prompt, seed, subject_size, progress))]
+    if mask is None:
+        tasks.append(asyncio.ensure_future(inference_executor.run(compute_mask, content, quality, subject)))
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        # Stop waiting on the other branch. This only cancels this request's
+        # awaiters; a shared generation is shielded by the background cache
+        # and still completes for the other requests waiting on it
+        for task in tasks:
+            task.cancel()
+        raise
+    background = results[0]
+    if mask is None:
+        mask = results[1]
+
+    await _report(progress, "composing", 85)
+    return await inference_executor.run(compose_subject_on_background, subject, background, mask, output_format, params)
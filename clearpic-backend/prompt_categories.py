@@ -0,0 +1,40 @@
+# Predefined prompt categories and prompt helpers; kept free of service imports
+# so offline tools (e.g. build_prompt_library.py) can use them without API
+# credentials
+import re
+
+PROMPT_CATEGORIES = {
+    'nature': [
+        'Serene mountain landscape with a lake',
+        'Tropical beach paradise',
+        'Misty forest with morning light',
+        'Autumn forest with colorful leaves',
+        'Snowy winter wonderland'
+    ],
+    'urban': [
+        'Modern city skyline at sunset',
+        'Cozy cafe interior',
+        'Neon-lit city streets',
+        'Historic European street',
+        'Modern office space'
+    ],
+    'abstract': [
+        'Geometric patterns with vibrant colors',
+        'Abstract fluid art',
+        'Minimalist design with negative space',
+        'Futuristic digital art',
+        'Abstract nature-inspired patterns'
+    ],
+    'fantasy': [
+        'Magical forest with glowing elements',
+        'Floating islands in the sky',
+        'Crystal cave with magical light',
+        'Enchanted garden with fairies',
+        'Mystical portal in ancient ruins'
+    ]
+}
+
+def normalize_prompt(prompt: str) -> str:
+    # Case, surrounding whitespace, repeated spaces and trailing full stops
+    # do not change what gets generated
+    return re.sub(r"\s+", " ", prompt).strip().rstrip(".").strip().lower()
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from image_encoding import encode_image, encode_params
+from openai_service import analyze_image, get_suggested_prompts
+from u2net_infer import reduced_decode_factor, REDUCED_DECODE_FLAGS, decode_image
+from utils.ttl_cache import TTLCache
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The vision model analyses images at low detail, so a small JPEG is enough
+ANALYSIS_MAX_SIDE = int(os.getenv("ANALYSIS_MAX_SIDE", "512"))
+ANALYSIS_JPEG_QUALITY = int(os.getenv("ANALYSIS_JPEG_QUALITY", "80"))
+# Uploads whose 64-bit dHashes differ in at most this many bits share suggestions
+SUGGESTION_HASH_DISTANCE = int(os.getenv("SUGGESTION_HASH_DISTANCE", "4"))
+
+# Analysis and suggestions keyed by perceptual hash
+suggestion_cache = TTLCache(
+    max_entries=int(os.getenv("SUGGESTION_CACHE_MAX_ENTRIES", "2048")),
+    ttl_seconds=float(os.getenv("SUGGESTION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+)
+
+
+def dhash(image: np.ndarray) -> int:
+    # 64-bit difference hash: compare horizontally adjacent pixels of a 9x8
+    # grayscale thumbnail; stable under resizing and re-encoding
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def prepare_for_analysis(image_data: bytes) -> Tuple[bytes, int]:
+    """Downscale an upload to at most ANALYSIS_MAX_SIDE and re-encode it as JPEG.
+    Returns (jpeg bytes, dHash)."""
+    try:
+        # Let the JPEG decoder skip detail we are about to throw away
+        factor = reduced_decode_factor(image_data, target=ANALYSIS_MAX_SIDE)
+        image = cv2.imdecode(np.frombuffer(image_data, np.uint8), REDUCED_DECODE_FLAGS[factor]) if factor > 1 else None
+        if image is None:
+            image = decode_image(image_data)
+
+        height, width = image.shape[:2]
+        scale = ANALYSIS_MAX_SIDE / max(height, width)
+        if scale < 1:
+            image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+
+        jpeg = encode_image(image, "jpeg", encode_params("jpeg", ANALYSIS_JPEG_QUALITY))
+        return jpeg, dhash(image)
+    except Exception as e:
+        raise Exception(f"Failed to prepare image for analysis: {str(e)}")
+
+
+def parse_prompts(content: Optional[str]) -> List[str]:
+    # The model is asked for a JSON array but may wrap it in a code fence
+    if not content:
+        return []
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("\n") + 1:] if "\n" in text else text
+    try:
+        prompts = json.loads(text)
+        if isinstance(prompts, list):
+            return [str(prompt).strip() for prompt in prompts if str(prompt).strip()]
+    except ValueError:
+        pass
+    # Fall back to one prompt per line
+    return [line.strip(" -*0123456789.\"") for line in text.splitlines() if line.strip(" -*0123456789.\"")]
+
+
+def find_similar(image_hash: int) -> Optional[dict]:
+    for key in suggestion_cache.keys():
+        if hamming(key, image_hash) <= SUGGESTION_HASH_DISTANCE:
+            cached = suggestion_cache.get(key)
+            if cached is not None:
+                return cached
+    return None
+
+
+async def suggest_prompts(jpeg: bytes, image_hash: int) -> Tuple[dict, bool]:
+    """Analysis and background prompt suggestions for a prepared image.
+    Returns (result, cached); repeat and near-identical uploads are served
+    from the cache without calling OpenAI."""
+    cached = find_similar(image_hash)
+    if cached is not None:
+        return cached, True
+
+    async def compute():
+        analysis = await analyze_image(jpeg)
+        if not analysis:
+            return None
+        prompts = parse_prompts(await get_suggested_prompts(analysis))
+        if not prompts:
+            return None
+        return {"analysis": analysis, "prompts": prompts}
+
+    result = await suggestion_cache.get_or_set(image_hash, compute)
+    if result is None:
+        raise Exception("Failed to generate prompt suggestions")
+    return result, False
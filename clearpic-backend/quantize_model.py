@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import fuse_modules, get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+# Add the current directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from model.u2net import U2NET, U2NETP, REBNCONV
+from u2net_infer import MODEL_VARIANTS, INT8_PATHS, load_checkpoint, preprocess_image, postprocess_mask
+
+QUANTIZE_MODELS = {
+    "u2net": U2NET,
+    "u2netp": U2NETP,
+}
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def load_images(folder: str, limit: int):
+    paths = sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )[:limit]
+    if not paths:
+        raise Exception(f"No images found in {folder}")
+    tensors = []
+    for path in paths:
+        with open(path, "rb") as f:
+            _, tensor = preprocess_image(f.read())
+        tensors.append(tensor.unsqueeze(0))
+    return paths, tensors
+
+
+def fuse_rebnconv(net: nn.Module) -> nn.Module:
+    # Fold every REBNCONV's conv -> bn -> relu into a single ConvReLU2d
+    for module in net.modules():
+        if isinstance(module, REBNCONV):
+            fuse_modules(module, [["conv_s1", "bn_s1", "relu_s1"]], inplace=True)
+    return net
+
+
+def quantize(net: nn.Module, calibration, engine: str = "x86"):
+    """Static INT8 post-training quantization; returns a TorchScript module
+    that u2net_infer.load_model can serve."""
+    torch.backends.quantized.engine = engine
+    net = fuse_rebnconv(net.eval())
+
+    # FX mode inserts the quant/dequant boundaries and handles the
+    # torch.cat / residual adds that eager mode would need rewritten
+    example = calibration[0]
+    prepared = prepare_fx(net, get_default_qconfig_mapping(engine), (example,))
+    with torch.no_grad():
+        for inputs in calibration:
+            prepared(inputs)
+    quantized = convert_fx(prepared)
+
+    with torch.no_grad():
+        return torch.jit.trace(quantized, example)
+
+
+def mask_iou(a: np.ndarray, b: np.ndarray, threshold: int = 128) -> float:
+    a = a >= threshold
+    b = b >= threshold
+    union = np.logical_or(a, b).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(a, b).sum() / union)
+
+
+def compare(fp32: nn.Module, int8, paths, tensors):
+    results = []
+    timings = {"fp32_ms": [], "int8_ms": []}
+    with torch.no_grad():
+        for path, inputs in zip(paths, tensors):
+            start = time.perf_counter()
+            expected = postprocess_mask(fp32(inputs)[0])
+            timings["fp32_ms"].append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            actual = postprocess_mask(int8(inputs)[0])
+            timings["int8_ms"].append((time.perf_counter() - start) * 1000)
+
+            results.append({"image": os.path.basename(path), "iou": round(mask_iou(expected, actual), 4)})
+
+    ious = [r["iou"] for r in results]
+    return {
+        "images": len(results),
+        "mean_iou": round(float(np.mean(ious)), 4),
+        "min_iou": round(float(np.min(ious)), 4),
+        "p5_iou": round(float(np.percentile(ious, 5)), 4),
+        "fp32_ms": round(float(np.median(timings["fp32_ms"])), 1),
+        "int8_ms": round(float(np.median(timings["int8_ms"])), 1),
+        "per_image": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate and export a static INT8 U2NET / U2NETP")
+    parser.add_argument("--variant", choices=list(QUANTIZE_MODELS), default="u2net")
+    parser.add_argument("--calibration-dir", required=True, help="Folder of sample images used for calibration")
+    parser.add_argument("--eval-dir", help="Folder of images for the IoU report (defaults to the calibration folder)")
+    parser.add_argument("--checkpoint", help="Source FP32 .pth checkpoint (defaults to the variant's configured path)")
+    parser.add_argument("--output", help="Destination TorchScript file (defaults to the variant's configured INT8 path)")
+    parser.add_argument("--limit", type=int, default=100, help="Maximum number of images to read from each folder")
+    parser.add_argument("--engine", default="x86", help="Quantized kernel backend (x86, fbgemm or qnnpack)")
+    args = parser.parse_args()
+
+    checkpoint = args.checkpoint or MODEL_VARIANTS[args.variant][1]
+    output = args.output or INT8_PATHS[args.variant]
+
+    try:
+        fp32 = load_checkpoint(QUANTIZE_MODELS[args.variant](3, 1), checkpoint).eval()
+        paths, calibration = load_images(args.calibration_dir, args.limit)
+        print(f"✅ Loaded {args.variant} and {len(calibration)} calibration images")
+
+        # Quantize a separate copy; fusion rewrites modules in place
+        int8 = quantize(load_checkpoint(QUANTIZE_MODELS[args.variant](3, 1), checkpoint), calibration, args.engine)
+        torch.jit.save(int8, output)
+        print(f"✅ Saved INT8 model to {output}")
+    except Exception as e:
+        print(f"❌ Quantization failed: {str(e)}")
+        sys.exit(1)
+
+    if args.eval_dir:
+        paths, tensors = load_images(args.eval_dir, args.limit)
+    else:
+        tensors = calibration
+
+    report = compare(fp32, int8, paths, tensors)
+    report.update({
+        "variant": args.variant,
+        "fp32_mb": round(os.path.getsize(checkpoint) / 1e6, 1),
+        "int8_mb": round(os.path.getsize(output) / 1e6, 1),
+    })
+    report_path = os.path.splitext(output)[0] + ".report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Mask IoU vs FP32: mean {report['mean_iou']}, min {report['min_iou']}, p5 {report['p5_iou']}")
+    print(f"Median latency: FP32 {report['fp32_ms']} ms, INT8 {report['int8_ms']} ms")
+    print(f"Model size: FP32 {report['fp32_mb']} MB, INT8 {report['int8_mb']} MB")
+    print(f"Report written to {report_path}")
@@ -1,11 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
-from middleware.auth import verify_token, check_credits
+from middleware.auth import verify_token
 from services.supabase_service import supabase_service
 from services.stripe_service import stripe_service
+from services.credit_ledger import credit_ledger, InsufficientCredits
+from utils.cursor import encode_cursor, decode_cursor
 from models.credit import CreditPurchase, CreditTransaction, CreditBalance
+import os
+from typing import Optional
 
 router = APIRouter()
 
+DEFAULT_PAGE_SIZE = int(os.getenv("TRANSACTIONS_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("TRANSACTIONS_MAX_PAGE_SIZE", "200"))
+
 @router.post("/purchase")
 async def purchase_credits(purchase: CreditPurchase, user = Depends(verify_token)):
     try:
@@ -22,34 +29,36 @@ async def purchase_credits(purchase: CreditPurchase, user = Depends(verify_token
 @router.get("/balance")
 async def get_credit_balance(user = Depends(verify_token)):
     try:
-        profile = await supabase_service.get_user_profile(user.id)
-        if not profile:
-            raise HTTPException(status_code=404, detail="Profile not found")
-        return CreditBalance(credits=profile.get("credits", 0), user_id=user.id)
+        # Includes usage not yet flushed to the database
+        return CreditBalance(credits=await credit_ledger.available(user.id), user_id=user.id)
+    except InsufficientCredits:
+        raise HTTPException(status_code=404, detail="Profile not found")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/transactions")
-async def get_credit_transactions(user = Depends(verify_token)):
+async def get_credit_transactions(limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, user = Depends(verify_token)):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        response = supabase_service.client.table("credit_transactions").select("*").eq("user_id", user.id).execute()
-        return response.data
+        # Fetch one extra row to learn whether another page exists
+        rows = await supabase_service.get_credit_transactions(user.id, limit + 1, before)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"transactions": rows[:limit], "next_cursor": next_cursor}
 
 @router.post("/use")
 async def use_credits(amount: int, user = Depends(verify_token)):
-    # Check if user has enough credits
-    await check_credits(user.id)
-    
-    # Deduct credits and create transaction
-    success = await supabase_service.update_user_credits(user.id, -amount)
-    if success:
-        await supabase_service.create_credit_transaction(
-            user.id,
-            -amount,
-            "usage",
-            "Background generation"
-        )
-        return {"message": "Credits deducted successfully"}
-    raise HTTPException(status_code=400, detail="Failed to deduct credits")
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    # Reserved and journaled in memory; the ledger writes to the database in batches
+    try:
+        async with credit_ledger.charge(user.id, amount, "Background generation"):
+            pass
+    except InsufficientCredits:
+        raise HTTPException(status_code=402, detail="Insufficient credits")
+    return {"message": "Credits deducted successfully"}
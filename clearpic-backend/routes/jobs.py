@@ -0,0 +1,140 @@
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from middleware.auth import get_user_plan
+from services.job_runner import job_runner
+from services.job_store import job_store, SUCCEEDED, FAILED, TERMINAL_STATES
+from pipelines import remove_background_pipeline, replace_background_pipeline
+from u2net_infer import resolve_quality
+from image_encoding import negotiate_format, encode_params, OUTPUT_FORMATS
+
+router = APIRouter()
+
+# Seconds between SSE keep-alive comments while a job is idle
+EVENT_KEEPALIVE_SECONDS = 15
+
+async def run_remove_bg_job(content: bytes, params: dict, progress):
+    result = await remove_background_pipeline(content, params["quality"], params["format"], params["encode_params"], progress)
+    return result, OUTPUT_FORMATS[params["format"]]
+
+async def run_replace_bg_job(content: bytes, params: dict, progress):
+    result = await replace_background_pipeline(content, params["prompt"], params["format"], params["encode_params"], progress, params.get("seed"), params.get("quality", "full"))
+    return result, OUTPUT_FORMATS[params["format"]]
+
+job_runner.register("remove-bg", run_remove_bg_job)
+job_runner.register("replace-bg", run_replace_bg_job)
+
+def job_view(job: dict) -> dict:
+    view = {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+    if job["status"] == SUCCEEDED:
+        view["result_url"] = f"/jobs/{job['id']}/result"
+    return view
+
+def get_job_or_404(job_id: str) -> dict:
+    job = job_store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+async def submit_job(kind: str, params: dict, file: UploadFile):
+    job = await job_runner.submit(kind, params, await file.read())
+    return JSONResponse(status_code=202, content=job_view(job), headers={"Location": f"/jobs/{job['id']}"})
+
+@router.post("/remove-bg")
+async def create_remove_bg_job(
+    request: Request,
+    file: UploadFile = File(...),
+    quality: Optional[str] = Form(None),
+    format: Optional[str] = Form(None),
+    output_quality: Optional[int] = Form(None),
+    lossless: bool = Form(False),
+    compression: Optional[int] = Form(None),
+    plan: Optional[str] = Depends(get_user_plan)
+):
+    try:
+        quality = resolve_quality(quality, plan)
+        output_format = negotiate_format(format, request.headers.get("accept"), has_alpha=True)
+        params = encode_params(output_format, output_quality, lossless, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await submit_job("remove-bg", {"quality": quality, "format": output_format, "encode_params": params}, file)
+
+@router.post("/replace-bg")
+async def create_replace_bg_job(
+    request: Request,
+    file: UploadFile = File(...),
+    prompt: str = Form(...),
+    quality: Optional[str] = Form(None),
+    format: Optional[str] = Form(None),
+    output_quality: Optional[int] = Form(None),
+    lossless: bool = Form(False),
+    compression: Optional[int] = Form(None),
+    seed: Optional[int] = Form(None),
+    plan: Optional[str] = Depends(get_user_plan)
+):
+    try:
+        quality = resolve_quality(quality, plan)
+        # The composite is opaque, so JPEG is allowed here
+        output_format = negotiate_format(format, request.headers.get("accept"), has_alpha=False)
+        params = encode_params(output_format, output_quality, lossless, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await submit_job("replace-bg", {"prompt": prompt, "seed": seed, "quality": quality, "format": output_format, "encode_params": params}, file)
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    return job_view(get_job_or_404(job_id))
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    get_job_or_404(job_id)
+
+    async def events():
+        last = None
+        while True:
+            version = job_runner.version
+            job = job_store.get(job_id)
+            if job is None:
+                yield "event: error\ndata: {\"detail\": \"Job not found\"}\n\n"
+                return
+            view = job_view(job)
+            if view != last:
+                last = view
+                event = job["status"] if job["status"] in TERMINAL_STATES else "progress"
+                yield f"event: {event}\ndata: {json.dumps(view)}\n\n"
+                if job["status"] in TERMINAL_STATES:
+                    return
+            if await request.is_disconnected():
+                return
+            if not await job_runner.wait_for_change(version, EVENT_KEEPALIVE_SECONDS):
+                # Keep proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = get_job_or_404(job_id)
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=409, detail=f"Job failed: {job['error']}")
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    result = job_store.read_result(job_id)
+    if result is None:
+        raise HTTPException(status_code=410, detail="Job result has expired")
+    return Response(content=result, media_type=job["media_type"])
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from middleware.auth import verify_token
 from services.stripe_service import stripe_service
+from services.supabase_service import supabase_service
 from models.subscription import SubscriptionCreate
 
 router = APIRouter()
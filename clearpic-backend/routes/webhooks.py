@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Request, HTTPException
 from services.stripe_service import stripe_service
 from services.supabase_service import supabase_service
+from services.credit_ledger import credit_ledger
 import stripe
 import os
 
@@ -56,6 +57,7 @@ async def handle_checkout_completed(session):
         amount = session.amount_total / 100  # Convert from cents
         credits = int(amount * 10)  # 1 credit = $0.10
         await supabase_service.update_user_credits(user_id, credits)
+        credit_ledger.invalidate(user_id)
         await supabase_service.create_credit_transaction(
             user_id,
             credits,
@@ -72,6 +74,8 @@ async def handle_subscription_updated(subscription):
             'current_period_start': subscription.current_period_start,
             'current_period_end': subscription.current_period_end
         })
+        # Drop the cached profile so the next request sees the new state
+        supabase_service.invalidate_profile(user_id)
 
 async def handle_subscription_deleted(subscription):
     user_id = await supabase_service.get_user_id_by_stripe_customer(subscription.customer)
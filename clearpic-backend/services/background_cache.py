@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from services.result_cache import ResultCache
+from prompt_categories import normalize_prompt
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def parse_sizes(value: str) -> List[Tuple[int, int]]:
+    sizes = []
+    for part in value.split(","):
+        if part.strip():
+            width, height = part.lower().split("x")
+            sizes.append((int(width), int(height)))
+    return sizes
+
+
+class BackgroundCache:
+    """Cache of generated backgrounds keyed by prompt and generation settings.
+
+    The encoded image from the generator is stored under the generation key
+    in `storage`. Copies resized to common subject sizes are kept as raw BGR
+    pixels in `resized_storage`, so a cached background at one of those
+    sizes needs neither a decode nor a resize. The copies are several times
+    larger than the encoded image, so they have their own budget and cannot
+    evict generations. Both are ResultCaches (memory LRU plus an optional
+    disk LRU, each with a byte budget); without `resized_storage` no copies
+    are kept.
+    """
+
+    def __init__(self, storage: ResultCache, resized_storage: Optional[ResultCache] = None, sizes: Optional[List[Tuple[int, int]]] = None):
+        self.storage = storage
+        self.resized_storage = resized_storage
+        self.sizes = set(sizes or []) if resized_storage is not None else set()
+        self._inflight = {}
+
+    def key(self, prompt: str, model: str, width: int, height: int, seed: Optional[int] = None) -> str:
+        return self.storage.make_key(normalize_prompt(prompt).encode("utf-8"), model, width, height, "random" if seed is None else seed)
+
+    def _resized_key(self, key: str, width: int, height: int) -> str:
+        return self.storage.make_key(key.encode("utf-8"), "resized", width, height)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.storage.get(key)
+
+    def get_resized(self, key: str, width: int, height: int) -> Optional[np.ndarray]:
+        if (width, height) not in self.sizes:
+            return None
+        pixels = self.resized_storage.get(self._resized_key(key, width, height))
+        if pixels is None:
+            return None
+        return np.frombuffer(pixels, np.uint8).reshape(height, width, 3)
+
+    async def get_or_generate(self, key: str, generate: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Return the cached background for `key`, calling `generate` on a miss.
+
+        Concurrent misses for the same key share one generation. It runs as
+        its own task that every caller only shields, so a caller that is
+        cancelled or fails elsewhere neither cancels the generation nor
+        loses its result for the others."""
+        loop = asyncio.get_running_loop()
+        background = await loop.run_in_executor(None, self.storage.get, key)
+        if background is not None:
+            return background
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._generate(key, generate))
+            task.add_done_callback(lambda done: self._generation_done(key, done))
+        return await asyncio.shield(task)
+
+    async def _generate(self, key: str, generate: Callable[[], Awaitable[bytes]]) -> bytes:
+        background = await generate()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.storage.put, key, background)
+        if self.sizes:
+            # Pre-resize in the background; callers do not wait for it
+            loop.run_in_executor(None, self._store_resized, key, background)
+        return background
+
+    def _generation_done(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Retrieve the outcome so a generation nobody awaited any more does not log a warning
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background generation failed for {key}: {str(task.exception())}")
+
+    def _store_resized(self, key: str, background: bytes):
+        try:
+            image = cv2.imdecode(np.frombuffer(background, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise Exception("Failed to decode background")
+            for width, height in self.sizes:
+                resized = cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+                self.resized_storage.put(self._resized_key(key, width, height), resized.tobytes())
+        except Exception as e:
+            logger.warning(f"Failed to pre-resize background {key}: {str(e)}")
+
+
+# Create a singleton instance
+background_cache = BackgroundCache(
+    ResultCache(
+        max_bytes=int(os.getenv("BACKGROUND_CACHE_MAX_BYTES", str(128 * 1024 * 1024))),
+        disk_dir=os.getenv("BACKGROUND_CACHE_DIR", "background_cache"),
+        disk_max_bytes=int(os.getenv("BACKGROUND_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+    ),
+    ResultCache(
+        max_bytes=int(os.getenv("BACKGROUND_RESIZED_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        disk_dir=os.getenv("BACKGROUND_RESIZED_CACHE_DIR", "background_cache_resized"),
+        disk_max_bytes=int(os.getenv("BACKGROUND_RESIZED_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+    ),
+    sizes=parse_sizes(os.getenv("BACKGROUND_CACHE_SIZES", "1080x1080,1080x1350,1080x1920,1920x1080"))
+)
@@ -0,0 +1,290 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from services.supabase_service import supabase_service
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE = "journal.jsonl"
+
+
+class InsufficientCredits(Exception):
+    pass
+
+
+class Reservation:
+    def __init__(self, user_id: str, amount: int):
+        self.user_id = user_id
+        self.amount = amount
+        self.settled = False
+
+
+class _Account:
+    def __init__(self):
+        # Balance as last read from (or returned by) the database
+        self.credits: Optional[int] = None
+        self.loaded_at = 0.0
+        # Bumped whenever `credits` is replaced so a slower load can't overwrite it
+        self.version = 0
+        # Held by in-flight reservations
+        self.reserved = 0
+        # Sum of journaled transactions not yet applied to the database
+        self.pending = 0
+
+
+class CreditLedger:
+    """In-process credit balances with reservations and a local journal.
+
+    `reserve` checks and holds credits in memory; there is no await between
+    the check and the hold, so concurrent requests on this process cannot
+    spend the same credits. `commit` appends the transaction to a JSONL
+    journal on disk and `refund` releases the hold; neither touches the
+    database. A background task rotates the journal into batch files and
+    applies each batch with one `apply_credit_transactions` call, which is
+    idempotent on transaction id, so batches left by a crash are simply
+    replayed on the next start.
+
+    Available credits are the database balance plus unapplied journal
+    entries minus reservations. The database balance is read once per user
+    and re-read after `balance_ttl_seconds` or `invalidate` (e.g. after a
+    purchase), which bounds staleness when several processes share users.
+    """
+
+    def __init__(self, journal_dir: str, flush_interval: float = 5.0, flush_batch: int = 500, balance_ttl_seconds: float = 60,
+                 max_accounts: int = 10000, fsync: bool = True):
+        self.journal_dir = journal_dir
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.balance_ttl_seconds = balance_ttl_seconds
+        self.max_accounts = max_accounts
+        self.fsync = fsync
+        self._accounts: "OrderedDict[str, _Account]" = OrderedDict()
+        self._loads: Dict[str, asyncio.Future] = {}
+        self._journal = None
+        self._journal_entries = 0
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        # Entries a previous process journaled but never applied still count
+        # against their users until they are flushed
+        self._rotate()
+        for path in self._batch_files():
+            for entry in self._read_batch(path):
+                self._account(entry["user_id"]).pending += entry["amount"]
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    async def available(self, user_id: str) -> int:
+        account = await self._load(user_id)
+        return account.credits + account.pending - account.reserved
+
+    async def reserve(self, user_id: str, amount: int) -> Reservation:
+        if amount <= 0:
+            raise ValueError("Amount must be positive")
+        account = await self._load(user_id)
+        # Check and hold without yielding to the event loop
+        if account.credits + account.pending - account.reserved < amount:
+            raise InsufficientCredits("Insufficient credits")
+        account.reserved += amount
+        return Reservation(user_id, amount)
+
+    def commit(self, reservation: Reservation, description: Optional[str] = None, type: str = "usage") -> dict:
+        if reservation.settled:
+            raise ValueError("Reservation already settled")
+        entry = {
+            "id": str(uuid.uuid4()),
+            "user_id": reservation.user_id,
+            "amount": -reservation.amount,
+            "type": type,
+            "description": description,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        self._append(entry)
+        account = self._account(reservation.user_id)
+        account.reserved -= reservation.amount
+        account.pending -= reservation.amount
+        reservation.settled = True
+        return entry
+
+    def refund(self, reservation: Reservation):
+        if reservation.settled:
+            return
+        self._account(reservation.user_id).reserved -= reservation.amount
+        reservation.settled = True
+
+    @asynccontextmanager
+    async def charge(self, user_id: str, amount: int, description: Optional[str] = None):
+        """Reserve `amount` for the duration of the block; commit it if the
+        block succeeds and refund it if it raises."""
+        reservation = await self.reserve(user_id, amount)
+        try:
+            yield reservation
+        except BaseException:
+            self.refund(reservation)
+            raise
+        if not reservation.settled:
+            self.commit(reservation, description)
+
+    def invalidate(self, user_id: str):
+        # The database balance changed elsewhere (e.g. a purchase); re-read it
+        account = self._accounts.get(user_id)
+        if account is not None:
+            account.credits = None
+            account.version += 1
+
+    async def flush(self):
+        """Apply all journaled transactions to the database in batches."""
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            self._rotate()
+            for path in self._batch_files():
+                entries = self._read_batch(path)
+                if entries:
+                    balances = await supabase_service.apply_credit_transactions(entries)
+                    if balances is None:
+                        # Keep the batch and retry on the next flush
+                        logger.warning(f"Failed to flush {len(entries)} credit transactions; will retry")
+                        return
+                    self._settle(entries, balances)
+                os.remove(path)
+
+    def _settle(self, entries: List[dict], balances: List[dict]):
+        for entry in entries:
+            self._account(entry["user_id"]).pending -= entry["amount"]
+        now = time.monotonic()
+        for row in balances:
+            account = self._account(row["user_id"])
+            account.credits = row["credits"]
+            account.loaded_at = now
+            account.version += 1
+            supabase_service.update_cached_profile(row["user_id"], credits=row["credits"])
+        # No balance comes back for users whose entries were all skipped as
+        # already inserted, e.g. a replay after a commit whose response was
+        # lost. Their known balance may predate those entries, so re-read it
+        updated = {row["user_id"] for row in balances}
+        for user_id in {entry["user_id"] for entry in entries} - updated:
+            self.invalidate(user_id)
+            supabase_service.invalidate_profile(user_id)
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Credit journal flush error: {str(e)}")
+
+    def _account(self, user_id: str) -> _Account:
+        account = self._accounts.get(user_id)
+        if account is None:
+            account = self._accounts[user_id] = _Account()
+            self._evict()
+        else:
+            self._accounts.move_to_end(user_id)
+        return account
+
+    def _evict(self):
+        # Drop the least recently used accounts that hold nothing in flight
+        for user_id in list(self._accounts):
+            if len(self._accounts) <= self.max_accounts:
+                break
+            account = self._accounts[user_id]
+            if not account.reserved and not account.pending and user_id not in self._loads:
+                del self._accounts[user_id]
+
+    async def _load(self, user_id: str) -> _Account:
+        account = self._account(user_id)
+        # Loop because an invalidation during the read discards its result
+        while account.credits is None or time.monotonic() - account.loaded_at >= self.balance_ttl_seconds:
+            future = self._loads.get(user_id)
+            if future is None:
+                future = self._loads[user_id] = asyncio.ensure_future(self._read_balance(user_id, account))
+                future.add_done_callback(lambda _: self._loads.pop(user_id, None))
+            await asyncio.shield(future)
+        return account
+
+    async def _read_balance(self, user_id: str, account: _Account):
+        version = account.version
+        profile = await supabase_service.get_user_profile(user_id, use_cache=False)
+        if profile is None:
+            raise InsufficientCredits("Profile not found")
+        # A flush or invalidation since the read started makes it stale
+        if account.version == version:
+            account.credits = profile.get("credits") or 0
+            account.loaded_at = time.monotonic()
+
+    def _append(self, entry: dict):
+        if self._journal is None:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            self._journal = open(os.path.join(self.journal_dir, JOURNAL_FILE), "a")
+        self._journal.write(json.dumps(entry) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._journal_entries += 1
+        if self._journal_entries >= self.flush_batch and self._wake is not None:
+            self._wake.set()
+
+    def _rotate(self):
+        # Move the live journal aside as a batch; new entries start a fresh file
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        path = os.path.join(self.journal_dir, JOURNAL_FILE)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            os.replace(path, os.path.join(self.journal_dir, f"batch-{time.time_ns()}.jsonl"))
+        self._journal_entries = 0
+
+    def _batch_files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.journal_dir, "batch-*.jsonl")))
+
+    def _read_batch(self, path: str) -> List[dict]:
+        entries = []
+        with open(path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A line torn by a crash mid-write was never acknowledged
+                    logger.warning(f"Skipping unreadable credit journal line in {path}")
+        return entries
+
+
+# Create a singleton instance
+credit_ledger = CreditLedger(
+    journal_dir=os.getenv("CREDIT_JOURNAL_DIR", "credit_journal"),
+    flush_interval=float(os.getenv("CREDIT_FLUSH_INTERVAL_SECONDS", "5")),
+    flush_batch=int(os.getenv("CREDIT_FLUSH_BATCH", "500")),
+    balance_ttl_seconds=float(os.getenv("CREDIT_BALANCE_TTL_SECONDS", "60")),
+    fsync=os.getenv("CREDIT_JOURNAL_FSYNC", "true").lower() != "false"
+)
@@ -0,0 +1,65 @@
+import logging
+import os
+from typing import Optional
+
+import httpx
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class HttpClient:
+    """Shared async HTTP client for outbound downloads.
+
+    One pooled httpx.AsyncClient is reused across requests so connections to
+    the same host (e.g. Replicate's delivery CDN) stay alive. Every download
+    has connect/read timeouts and a byte cap enforced while streaming.
+    """
+
+    def __init__(self, max_connections: int = 20, max_keepalive: int = 10, timeout: float = 30.0, connect_timeout: float = 5.0, max_bytes: int = 20 * 1024 * 1024):
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_bytes = max_bytes
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, follow_redirects=True)
+        return self._client
+
+    async def fetch_bytes(self, url: str, max_bytes: Optional[int] = None) -> bytes:
+        """Download `url` into memory, failing once the body exceeds `max_bytes`."""
+        max_bytes = max_bytes or self.max_bytes
+        try:
+            async with self.client.stream("GET", url) as response:
+                response.raise_for_status()
+                declared = int(response.headers.get("content-length") or 0)
+                if declared > max_bytes:
+                    raise Exception(f"Response is {declared} bytes; the limit is {max_bytes}")
+
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body += chunk
+                    if len(body) > max_bytes:
+                        raise Exception(f"Response exceeds {max_bytes} bytes")
+                return bytes(body)
+        except Exception as e:
+            raise Exception(f"Failed to download {url}: {str(e)}")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Create a singleton instance
+http_client = HttpClient(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+    max_keepalive=int(os.getenv("HTTP_MAX_KEEPALIVE", "10")),
+    timeout=float(os.getenv("HTTP_TIMEOUT_SECONDS", "30")),
+    connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5")),
+    max_bytes=int(os.getenv("HTTP_MAX_DOWNLOAD_BYTES", str(20 * 1024 * 1024)))
+)
@@ -0,0 +1,68 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class InferenceExecutor:
+    """Bounded thread pool for CPU-heavy work (decode, inference, encode).
+
+    At most `max_workers` jobs run at once and at most `max_queue` more may
+    wait; anything beyond that is rejected with a 503 instead of piling up,
+    so the event loop stays free for lightweight endpoints.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 16):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                logger.warning(f"Inference queue full ({self._pending} pending), rejecting request")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server is busy processing images. Please try again shortly.",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+
+        try:
+            future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self._release()
+            raise
+        # Release the slot when the work actually finishes, even if the
+        # awaiting request was cancelled (e.g. the client disconnected)
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+# Create a singleton instance
+inference_executor = InferenceExecutor(
+    max_workers=int(os.getenv("INFERENCE_CONCURRENCY", str(min(4, os.cpu_count() or 1)))),
+    max_queue=int(os.getenv("INFERENCE_QUEUE_DEPTH", "16"))
+)
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from services.job_store import JobStore, job_store, QUEUED, TERMINAL_STATES
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# progress(stage, percent)
+ProgressCallback = Callable[[str, int], Awaitable[None]]
+# handler(input_data, params, progress) -> (result bytes, media type)
+JobHandler = Callable[[bytes, dict, ProgressCallback], Awaitable[Tuple[bytes, str]]]
+
+
+class JobRunner:
+    """Runs persisted jobs on a fixed number of asyncio worker tasks.
+
+    Handlers are registered per job kind. Every progress or status change
+    wakes anyone waiting in `wait_for_change`, which is what the SSE endpoint
+    uses. Unfinished jobs from a previous process are picked up on `start`.
+    """
+
+    def __init__(self, store: JobStore, workers: int = 2, max_attempts: int = 2, purge_interval: int = 3600, retry_delay: float = 1.0):
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.purge_interval = purge_interval
+        self.retry_delay = retry_delay
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._changed: Optional[asyncio.Condition] = None
+        self._version = 0
+        self._tasks = []
+
+    def register(self, kind: str, handler: JobHandler):
+        self._handlers[kind] = handler
+
+    def kinds(self):
+        return list(self._handlers)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._changed = asyncio.Condition()
+        self.store.purge_expired()
+        recovered = self.store.recover()
+        if recovered:
+            logger.info(f"Resuming {len(recovered)} unfinished jobs")
+        for job_id in recovered:
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker(index)) for index in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._purge_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, params: dict, input_data: bytes) -> dict:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        job = self.store.create(kind, params, input_data)
+        await self._queue.put(job["id"])
+        return job
+
+    @property
+    def version(self) -> int:
+        # Bumped on every job update; pass it to `wait_for_change`
+        return self._version
+
+    async def wait_for_change(self, version: int, timeout: float) -> bool:
+        # Waits until any job changed after `version`; False if `timeout` passed first
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self._version != version), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    async def _notify(self):
+        async with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Job worker {index} crashed on {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATES:
+            return
+        if job["attempts"] >= self.max_attempts:
+            # Interrupted too many times (e.g. it keeps taking the process down)
+            self.store.fail(job_id, "Job was interrupted too many times")
+            await self._notify()
+            return
+
+        self.store.mark_running(job_id)
+        await self._notify()
+
+        async def progress(stage: str, percent: int):
+            self.store.update(job_id, stage=stage, progress=percent)
+            await self._notify()
+
+        try:
+            handler = self._handlers[job["kind"]]
+            result, media_type = await handler(self.store.read_input(job_id), job["params"], progress)
+            self.store.complete(job_id, result, media_type)
+        except asyncio.CancelledError:
+            # Shutting down; the job stays running and is requeued on restart
+            raise
+        except Exception as e:
+            if getattr(e, "status_code", None) == 503:
+                # Inference queue is full; put the job back and retry shortly
+                self.store.update(job_id, status=QUEUED, stage=QUEUED, progress=0, attempts=job["attempts"])
+                asyncio.get_running_loop().call_later(self.retry_delay, self._queue.put_nowait, job_id)
+                await self._notify()
+                return
+            logger.error(f"Job {job_id} ({job['kind']}) failed: {str(e)}")
+            self.store.fail(job_id, str(getattr(e, "detail", None) or e))
+        await self._notify()
+
+    async def _purge_loop(self):
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            try:
+                self.store.purge_expired()
+            except Exception as e:
+                logger.error(f"Failed to purge expired jobs: {str(e)}")
+
+
+# Create a singleton instance
+job_runner = JobRunner(
+    job_store,
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+)
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL_STATES = (SUCCEEDED, FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress INTEGER NOT NULL DEFAULT 0,
+    params TEXT NOT NULL,
+    media_type TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """SQLite-backed store for background jobs.
+
+    Job rows hold status and progress; the uploaded input and the finished
+    result are kept as files next to the database so rows stay small. Writes
+    are serialised through one connection, which is plenty for job metadata.
+    """
+
+    def __init__(self, data_dir: str, ttl_seconds: int = 24 * 3600):
+        self.data_dir = data_dir
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.join(data_dir, "inputs"), exist_ok=True)
+        os.makedirs(os.path.join(data_dir, "results"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(data_dir, "jobs.db"), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _input_path(self, job_id: str) -> str:
+        return os.path.join(self.data_dir, "inputs", job_id)
+
+    def _result_path(self, job_id: str) -> str:
+        return os.path.join(self.data_dir, "results", job_id)
+
+    def create(self, kind: str, params: dict, input_data: bytes) -> dict:
+        job_id = uuid.uuid4().hex
+        _write_atomic(self._input_path(job_id), input_data)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, stage, progress, params, created_at, updated_at) VALUES (?, ?, ?, ?, 0, ?, ?, ?)",
+                (job_id, kind, QUEUED, QUEUED, json.dumps(params), now, now)
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def read_input(self, job_id: str) -> bytes:
+        with open(self._input_path(job_id), "rb") as f:
+            return f.read()
+
+    def read_result(self, job_id: str) -> Optional[bytes]:
+        try:
+            with open(self._result_path(job_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def mark_running(self, job_id: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (RUNNING, time.time(), job_id)
+            )
+
+    def complete(self, job_id: str, result: bytes, media_type: str):
+        _write_atomic(self._result_path(job_id), result)
+        self.update(job_id, status=SUCCEEDED, stage="done", progress=100, media_type=media_type, error=None)
+        _remove(self._input_path(job_id))
+
+    def fail(self, job_id: str, error: str):
+        self.update(job_id, status=FAILED, error=error)
+        _remove(self._input_path(job_id))
+
+    def recover(self) -> List[str]:
+        """Requeue jobs left running by a previous process and return the ids
+        of every unfinished job, oldest first."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, progress = 0, updated_at = ? WHERE status = ?",
+                (QUEUED, QUEUED, time.time(), RUNNING)
+            )
+            rows = self._conn.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)).fetchall()
+        return [row["id"] for row in rows]
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT id FROM jobs WHERE updated_at < ?", (cutoff,)).fetchall()
+            self._conn.execute("DELETE FROM jobs WHERE updated_at < ?", (cutoff,))
+        for row in rows:
+            _remove(self._input_path(row["id"]))
+            _remove(self._result_path(row["id"]))
+        if rows:
+            logger.info(f"Purged {len(rows)} expired jobs")
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _row_to_job(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    return job
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# Create a singleton instance
+job_store = JobStore(
+    data_dir=os.getenv("JOB_DATA_DIR", "job_data"),
+    ttl_seconds=int(os.getenv("JOB_TTL_SECONDS", str(24 * 3600)))
+)
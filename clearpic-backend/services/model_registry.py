@@ -0,0 +1,94 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models, keyed by variant name.
+
+    Variants are registered with a loader (and optionally a warmup callable)
+    and are built at most once per process. `preload` is meant to be called
+    from the app startup hook so the first request never pays for loading.
+    """
+
+    def __init__(self, warmup_runs: int = 2):
+        self.warmup_runs = warmup_runs
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._warmups: Dict[str, Optional[Callable[[Any, int], None]]] = {}
+        self._models: Dict[str, Any] = {}
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any], warmup: Optional[Callable[[Any, int], None]] = None):
+        self._loaders[name] = loader
+        self._warmups[name] = warmup
+        self._status[name] = {"state": "registered"}
+
+    def variants(self) -> List[str]:
+        return list(self._loaders.keys())
+
+    def get(self, name: str) -> Any:
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        # Lazy load for variants that were not preloaded
+        return self._load(name)
+
+    def preload(self, names: Optional[List[str]] = None):
+        for name in names or self.variants():
+            try:
+                self._load(name)
+            except Exception as e:
+                logger.error(f"Failed to preload model '{name}': {str(e)}")
+
+    def is_ready(self, names: Optional[List[str]] = None) -> bool:
+        names = names or self.variants()
+        return bool(names) and all(self._status.get(name, {}).get("state") == "ready" for name in names)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {name: dict(status) for name, status in self._status.items()}
+
+    def _load(self, name: str) -> Any:
+        if name not in self._loaders:
+            raise KeyError(f"Unknown model variant '{name}'")
+
+        with self._lock:
+            model = self._models.get(name)
+            if model is not None:
+                return model
+
+            try:
+                self._status[name] = {"state": "loading"}
+                start = time.perf_counter()
+                model = self._loaders[name]()
+                load_ms = (time.perf_counter() - start) * 1000
+
+                self._status[name] = {"state": "warming", "load_ms": round(load_ms, 1)}
+                warmup = self._warmups.get(name)
+                start = time.perf_counter()
+                if warmup and self.warmup_runs > 0:
+                    warmup(model, self.warmup_runs)
+                warmup_ms = (time.perf_counter() - start) * 1000
+            except Exception as e:
+                self._status[name] = {"state": "failed", "error": str(e)}
+                raise
+
+            self._models[name] = model
+            self._status[name] = {
+                "state": "ready",
+                "load_ms": round(load_ms, 1),
+                "warmup_ms": round(warmup_ms, 1),
+                "warmup_runs": self.warmup_runs if warmup else 0,
+            }
+            logger.info(f"Model '{name}' ready (load {load_ms:.0f} ms, warmup {warmup_ms:.0f} ms)")
+            return model
+
+
+# Create a singleton instance
+model_registry = ModelRegistry(warmup_runs=int(os.getenv("MODEL_WARMUP_RUNS", "2")))
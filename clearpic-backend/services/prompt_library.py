@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import random
+import threading
+from typing import Optional
+
+from prompt_categories import normalize_prompt
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+
+
+class PromptLibrary:
+    """Pre-rendered backgrounds for the curated prompts, built offline by
+    build_prompt_library.py.
+
+    The index maps each normalized prompt to its rendered variants and their
+    seeds. It is reloaded when index.json changes on disk, so a rebuilt
+    library is picked up without a restart.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._index = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            self._index, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(path) as f:
+                self._index = json.load(f).get("prompts", {})
+            self._mtime = mtime
+            logger.info(f"Loaded prompt library with {len(self._index)} prompts from {self.root}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load prompt library index: {str(e)}")
+
+    def entry(self, prompt: str) -> Optional[dict]:
+        with self._lock:
+            self._refresh()
+            return self._index.get(normalize_prompt(prompt))
+
+    def load(self, prompt: str, seed: Optional[int] = None) -> Optional[bytes]:
+        """Return a pre-rendered background for `prompt`, or None if the library
+        has none. A given seed must match a rendered variant's seed; without
+        one a variant is picked at random."""
+        entry = self.entry(prompt)
+        if not entry or not entry.get("variants"):
+            return None
+        variants = entry["variants"]
+        if seed is None:
+            variant = random.choice(variants)
+        else:
+            variant = next((v for v in variants if v["seed"] == seed), None)
+            if variant is None:
+                return None
+        try:
+            with open(os.path.join(self.root, variant["file"]), "rb") as f:
+                return f.read()
+        except OSError as e:
+            logger.warning(f"Prompt library file missing for '{prompt}': {str(e)}")
+            return None
+
+
+# Create a singleton instance
+prompt_library = PromptLibrary(os.getenv("PROMPT_LIBRARY_DIR", "prompt_library"))
@@ -1,8 +1,10 @@
 from supabase import create_client, Client
+from postgrest.utils import sanitize_param
 import os
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from dotenv import load_dotenv
+from utils.ttl_cache import TTLCache
 
 # Load environment variables
 load_dotenv()
@@ -11,6 +13,9 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Columns returned by the transaction history endpoint
+TRANSACTION_COLUMNS = "id, amount, type, description, created_at"
+
 class SupabaseService:
     def __init__(self):
         try:
@@ -28,6 +33,13 @@ class SupabaseService:
             # Initialize clients
             self.client: Client = create_client(supabase_url, supabase_anon_key)
             self.service_client: Client = create_client(supabase_url, supabase_service_key)
+
+            # Profile rows per process; mutations below write through, webhooks
+            # invalidate, and the TTL bounds staleness from other processes
+            self.profile_cache = TTLCache(
+                max_entries=int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000")),
+                ttl_seconds=float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+            )
             
             # Verify connection and auth setup
             try:
@@ -140,5 +152,133 @@ class SupabaseService:
             logger.error(f"Get session error: {str(e)}")
             return None
 
+    async def get_user_profile(self, user_id: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        # Served from the in-process profile cache; concurrent misses share one query
+        if use_cache:
+            profile = await self.profile_cache.get_or_set(user_id, lambda: self._fetch_user_profile(user_id))
+        else:
+            profile = await self._fetch_user_profile(user_id)
+        # Callers get their own copy so they can't modify the cached row
+        return dict(profile) if profile else None
+
+    async def _fetch_user_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = self.service_client.table("profiles").select("*").eq("id", user_id).limit(1).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            logger.error(f"Get user profile error: {str(e)}")
+            return None
+
+    def invalidate_profile(self, user_id: str):
+        self.profile_cache.invalidate(user_id)
+
+    def update_cached_profile(self, user_id: str, **fields):
+        # Write-through: patch a cached row in place of re-reading it
+        profile = self.profile_cache.get(user_id)
+        if profile is not None:
+            self.profile_cache.set(user_id, {**profile, **fields})
+
+    async def update_user_credits(self, user_id: str, amount: int) -> bool:
+        """Atomically add `amount` (negative to deduct) to the user's credits.
+        Returns False if the user is missing or the balance would go negative."""
+        try:
+            response = self.service_client.rpc("adjust_credits", {"p_user_id": user_id, "p_amount": amount}).execute()
+            if response.data is None:
+                return False
+            self.update_cached_profile(user_id, credits=response.data)
+            return True
+        except Exception as e:
+            logger.error(f"Update user credits error: {str(e)}")
+            self.invalidate_profile(user_id)
+            return False
+
+    async def apply_credit_transactions(self, entries: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Insert a batch of credit transactions and apply them to balances in
+        one database transaction. Entries already inserted (same id) are
+        skipped. Returns the new balances of the affected users, or None on
+        failure."""
+        try:
+            response = self.service_client.rpc("apply_credit_transactions", {"p_entries": entries}).execute()
+            return response.data or []
+        except Exception as e:
+            logger.error(f"Apply credit transactions error: {str(e)}")
+            return None
+
+    async def get_credit_transactions(self, user_id: str, limit: int, before: Optional[Tuple[str, str]] = None) -> List[Dict[str, Any]]:
+        """Newest-first page of a user's transactions. `before` is the
+        (created_at, id) of the last row of the previous page; the seek uses
+        the (user_id, created_at, id) index instead of an offset scan."""
+        try:
+            query = self.service_client.table("credit_transactions") \
+                .select(TRANSACTION_COLUMNS) \
+                .eq("user_id", user_id)
+            if before is not None:
+                created_at, transaction_id = map(sanitize_param, before)
+                query = query.or_(f"created_at.lt.{created_at},and(created_at.eq.{created_at},id.lt.{transaction_id})")
+            # id breaks ties between rows written in the same batch
+            return query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute().data
+        except Exception as e:
+            raise Exception(f"Failed to fetch credit transactions: {str(e)}")
+
+    async def create_credit_transaction(self, user_id: str, amount: int, type: str, description: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        try:
+            response = self.service_client.table("credit_transactions").insert({
+                "user_id": user_id,
+                "amount": amount,
+                "type": type,
+                "description": description
+            }).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            logger.error(f"Create credit transaction error: {str(e)}")
+            return None
+
+    async def update_user_stripe_id(self, user_id: str, customer_id: str) -> bool:
+        try:
+            self.service_client.table("profiles").update({"stripe_customer_id": customer_id}).eq("id", user_id).execute()
+            self.update_cached_profile(user_id, stripe_customer_id=customer_id)
+            return True
+        except Exception as e:
+            logger.error(f"Update user stripe id error: {str(e)}")
+            self.invalidate_profile(user_id)
+            return False
+
+    async def update_user_subscription_status(self, user_id: str, status: str) -> bool:
+        try:
+            self.service_client.table("profiles").update({"subscription_status": status}).eq("id", user_id).execute()
+            self.update_cached_profile(user_id, subscription_status=status)
+            return True
+        except Exception as e:
+            logger.error(f"Update subscription status error: {str(e)}")
+            self.invalidate_profile(user_id)
+            return False
+
+    async def get_user_id_by_stripe_customer(self, customer_id: str) -> Optional[str]:
+        try:
+            response = self.service_client.table("profiles").select("id").eq("stripe_customer_id", customer_id).limit(1).execute()
+            return response.data[0]["id"] if response.data else None
+        except Exception as e:
+            logger.error(f"Get user by stripe customer error: {str(e)}")
+            return None
+
+    async def create_subscription(self, subscription: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            response = self.service_client.table("subscriptions").insert(subscription).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            logger.error(f"Create subscription error: {str(e)}")
+            return None
+        finally:
+            self.invalidate_profile(subscription.get("user_id"))
+
+    async def update_subscription(self, subscription: Dict[str, Any]) -> bool:
+        try:
+            fields = {key: value for key, value in subscription.items() if key != "stripe_subscription_id"}
+            self.service_client.table("subscriptions").update(fields).eq("stripe_subscription_id", subscription["stripe_subscription_id"]).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Update subscription error: {str(e)}")
+            return False
+
 # Create a singleton instance
 supabase_service = SupabaseService() 
\ No newline at end of file
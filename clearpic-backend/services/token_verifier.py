@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from jose import jwt, JWTError
+
+from models.user import AuthenticatedUser
+from services.http_client import http_client
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HMAC_ALGORITHMS = ["HS256"]
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256"]
+
+
+class TokenError(Exception):
+    pass
+
+
+class TokenVerifier:
+    """Verifies Supabase access tokens locally.
+
+    HS256 tokens are checked with the project JWT secret and RS256/ES256
+    tokens against the project's JWKS, which is cached and refetched when a
+    token names an unknown key id. Expiry, not-before, audience, issuer and
+    subject are validated. Verified tokens are kept in an LRU until they
+    expire. `remote_lookup` (a Supabase get_user call) is used only when
+    there is no local key material, and optionally to re-check cached tokens
+    for revocation every `revalidate_seconds`.
+    """
+
+    def __init__(self, secret: Optional[str] = None, jwks_url: Optional[str] = None, audience: Optional[str] = "authenticated", issuer: Optional[str] = None,
+                 max_entries: int = 4096, jwks_ttl_seconds: int = 3600, revalidate_seconds: int = 0, leeway_seconds: int = 10,
+                 remote_lookup: Optional[Callable[[str], Awaitable[AuthenticatedUser]]] = None):
+        self.secret = secret
+        self.jwks_url = jwks_url
+        self.audience = audience
+        self.issuer = issuer
+        self.max_entries = max_entries
+        self.jwks_ttl_seconds = jwks_ttl_seconds
+        self.revalidate_seconds = revalidate_seconds
+        self.leeway_seconds = leeway_seconds
+        self.remote_lookup = remote_lookup
+        # sha256(token) -> (expires_at, checked_at, user)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._jwks = {}
+        self._jwks_fetched_at = 0.0
+        self._jwks_attempted_at = 0.0
+        self._jwks_lock: Optional[asyncio.Lock] = None
+
+    async def verify(self, token: str) -> AuthenticatedUser:
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        now = time.time()
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            expires_at, checked_at, user = cached
+            if expires_at > now:
+                self._cache.move_to_end(key)
+                if self.revalidate_seconds and self.remote_lookup and now - checked_at > self.revalidate_seconds:
+                    user = await self._remote(token)
+                    self._cache[key] = (expires_at, now, user)
+                return user
+            del self._cache[key]
+
+        try:
+            claims = await self._decode(token)
+        except TokenError:
+            raise
+        except JWTError as e:
+            raise TokenError(f"Invalid token: {str(e)}")
+
+        if claims is None:
+            # No local key material for this token; ask Supabase
+            user = await self._remote(token)
+            expires_at = user.expires_at or now + 60
+        else:
+            user = AuthenticatedUser(
+                id=claims["sub"],
+                email=claims.get("email"),
+                role=claims.get("role"),
+                expires_at=claims["exp"],
+                claims=claims
+            )
+            expires_at = claims["exp"]
+
+        self._cache[key] = (expires_at, now, user)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return user
+
+    def forget(self, token: str):
+        self._cache.pop(hashlib.sha256(token.encode("utf-8")).hexdigest(), None)
+
+    async def _decode(self, token: str) -> Optional[dict]:
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get("alg")
+        options = {"require_exp": True, "require_sub": True, "leeway": self.leeway_seconds, "verify_aud": self.audience is not None}
+
+        if algorithm in HMAC_ALGORITHMS:
+            if not self.secret:
+                return None
+            key = self.secret
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            key = await self._signing_key(header.get("kid"))
+            if key is None:
+                return None
+        else:
+            raise TokenError(f"Unsupported token algorithm '{algorithm}'")
+
+        return jwt.decode(token, key, algorithms=[algorithm], audience=self.audience, issuer=self.issuer, options=options)
+
+    async def _signing_key(self, kid: Optional[str]) -> Optional[dict]:
+        if not self.jwks_url:
+            return None
+        if self._jwks_lock is None:
+            self._jwks_lock = asyncio.Lock()
+
+        async with self._jwks_lock:
+            now = time.time()
+            stale = now - self._jwks_fetched_at > self.jwks_ttl_seconds
+            # Refetch when stale or on an unknown kid (key rotation), but at
+            # most once a minute so bad tokens or an outage can't hammer it
+            if (stale or kid not in self._jwks) and now - self._jwks_attempted_at > 60:
+                self._jwks_attempted_at = now
+                try:
+                    body = await http_client.fetch_bytes(self.jwks_url, max_bytes=256 * 1024)
+                    self._jwks = {k.get("kid"): k for k in json.loads(body).get("keys", [])}
+                    self._jwks_fetched_at = now
+                except Exception as e:
+                    logger.warning(f"Failed to fetch JWKS: {str(e)}")
+        return self._jwks.get(kid)
+
+    async def _remote(self, token: str) -> AuthenticatedUser:
+        if self.remote_lookup is None:
+            raise TokenError("No key available to verify token")
+        return await self.remote_lookup(token)
+
+
+def _issuer() -> Optional[str]:
+    if os.getenv("SUPABASE_JWT_ISSUER"):
+        return os.getenv("SUPABASE_JWT_ISSUER")
+    url = os.getenv("SUPABASE_URL")
+    return f"{url.rstrip('/')}/auth/v1" if url else None
+
+
+def _jwks_url() -> Optional[str]:
+    if os.getenv("SUPABASE_JWKS_URL"):
+        return os.getenv("SUPABASE_JWKS_URL")
+    url = os.getenv("SUPABASE_URL")
+    return f"{url.rstrip('/')}/auth/v1/.well-known/jwks.json" if url else None
+
+
+# Create a singleton instance; middleware.auth sets remote_lookup
+token_verifier = TokenVerifier(
+    secret=os.getenv("SUPABASE_JWT_SECRET") or None,
+    jwks_url=_jwks_url(),
+    audience=os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated") or None,
+    issuer=_issuer(),
+    max_entries=int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "4096")),
+    revalidate_seconds=int(os.getenv("TOKEN_REVALIDATE_SECONDS", "0"))
+)
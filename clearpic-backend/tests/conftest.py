@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Make the backend modules importable when pytest runs from any directory
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
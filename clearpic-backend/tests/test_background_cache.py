@@ -0,0 +1,48 @@
+import asyncio
+
+from services.background_cache import BackgroundCache
+from services.result_cache import ResultCache
+
+
+def test_owner_cancellation_does_not_reach_waiters():
+    cache = BackgroundCache(ResultCache())
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return b"background"
+
+    async def scenario():
+        owner = asyncio.ensure_future(cache.get_or_generate("key", generate))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(cache.get_or_generate("key", generate))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        return owner, await waiter
+
+    owner, result = asyncio.run(scenario())
+
+    assert owner.cancelled()
+    assert result == b"background"
+    assert len(calls) == 1
+    # The generation still completed and was cached for later requests
+    assert cache.get("key") == b"background"
+    assert cache._inflight == {}
+
+
+def test_failures_reach_every_waiter_and_are_not_cached():
+    cache = BackgroundCache(ResultCache())
+
+    async def generate():
+        await asyncio.sleep(0.01)
+        raise Exception("generation failed")
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_generate("key", generate) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert [str(result) for result in results] == ["generation failed"] * 3
+    assert cache.get("key") is None
+    assert cache._inflight == {}
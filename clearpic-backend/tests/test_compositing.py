@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from compositing import blend_into, merge_alpha
+
+
+def reference_blend(background, foreground, alpha):
+    a = alpha.astype(np.float64)[:, :, None]
+    blended = (foreground.astype(np.float64) * a + background.astype(np.float64) * (255 - a)) / 255
+    return np.round(blended).astype(np.uint8)
+
+
+def test_rounded_division_by_255_is_exact():
+    # Every value fg * a + bg * (255 - a) can take
+    x = np.arange(255 * 255 + 1, dtype=np.uint32)
+    shifted = x + 128
+    assert np.array_equal((shifted + (shifted >> 8)) >> 8, np.round(x / 255).astype(np.uint32))
+
+
+@pytest.mark.parametrize("strip_rows", [1, 7, 64, None])
+def test_blend_matches_float_reference(strip_rows):
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 256, (53, 41, 3), dtype=np.uint8)
+    foreground = rng.integers(0, 256, (53, 41, 3), dtype=np.uint8)
+    alpha = rng.integers(0, 256, (53, 41), dtype=np.uint8)
+    alpha[0, :] = 0
+    alpha[1, :] = 255
+    expected = reference_blend(background, foreground, alpha)
+
+    result = blend_into(background, foreground, alpha, strip_rows)
+
+    assert result is background
+    assert np.array_equal(result, expected)
+
+
+def test_blend_rejects_mismatched_sizes():
+    image = np.zeros((4, 4, 3), dtype=np.uint8)
+    with pytest.raises(ValueError):
+        blend_into(image, image.copy(), np.zeros((4, 5), dtype=np.uint8))
+
+
+def test_merge_alpha_appends_channel():
+    image = np.full((2, 3, 3), 7, dtype=np.uint8)
+    alpha = np.arange(6, dtype=np.uint8).reshape(2, 3)
+
+    result = merge_alpha(image, alpha)
+
+    assert result.shape == (2, 3, 4)
+    assert np.array_equal(result[:, :, :3], image)
+    assert np.array_equal(result[:, :, 3], alpha)
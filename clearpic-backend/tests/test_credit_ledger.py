@@ -0,0 +1,173 @@
+import asyncio
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+USER = "3f058d4d-5eac-416c-aa1b-6f2c2a2df872"
+
+
+class FakeSupabaseService:
+    """Profiles and apply_credit_transactions() as the SQL function behaves:
+    rows are inserted once per id and balances move by what was inserted."""
+
+    def __init__(self, credits: int):
+        self.credits = credits
+        self.applied = set()
+        self.reads = 0
+        self.lose_response = False
+
+    async def get_user_profile(self, user_id, use_cache=True):
+        self.reads += 1
+        return {"id": user_id, "credits": self.credits}
+
+    async def apply_credit_transactions(self, entries):
+        inserted = [entry for entry in entries if entry["id"] not in self.applied]
+        for entry in inserted:
+            self.applied.add(entry["id"])
+            self.credits += entry["amount"]
+        if self.lose_response:
+            # Committed in the database, but the caller never hears back
+            return None
+        return [{"user_id": USER, "credits": self.credits}] if inserted else []
+
+    def update_cached_profile(self, user_id, **fields):
+        pass
+
+    def invalidate_profile(self, user_id):
+        pass
+
+
+@pytest.fixture
+def ledger_module(monkeypatch):
+    # credit_ledger imports the Supabase singleton, which connects on import
+    fake_module = types.ModuleType("services.supabase_service")
+    fake_module.supabase_service = FakeSupabaseService(0)
+    monkeypatch.setitem(sys.modules, "services.supabase_service", fake_module)
+    monkeypatch.delitem(sys.modules, "services.credit_ledger", raising=False)
+    module = importlib.import_module("services.credit_ledger")
+    yield module
+    sys.modules.pop("services.credit_ledger", None)
+
+
+def make_ledger(module, journal_dir, credits):
+    service = FakeSupabaseService(credits)
+    module.supabase_service = service
+    return module.CreditLedger(str(journal_dir), flush_interval=3600, fsync=False), service
+
+
+def test_concurrent_charges_never_overspend(ledger_module, tmp_path):
+    ledger, service = make_ledger(ledger_module, tmp_path, credits=3)
+
+    async def use():
+        try:
+            async with ledger.charge(USER, 1, "test"):
+                await asyncio.sleep(0.01)
+            return True
+        except ledger_module.InsufficientCredits:
+            return False
+
+    async def scenario():
+        await ledger.start()
+        results = await asyncio.gather(*(use() for _ in range(10)))
+        available = await ledger.available(USER)
+        await ledger.stop()
+        return results, available
+
+    results, available = asyncio.run(scenario())
+
+    assert sum(results) == 3
+    assert available == 0
+    assert service.reads == 1
+    assert service.credits == 0
+
+
+def test_refund_releases_the_reservation(ledger_module, tmp_path):
+    ledger, service = make_ledger(ledger_module, tmp_path, credits=5)
+
+    async def scenario():
+        await ledger.start()
+        reservation = await ledger.reserve(USER, 2)
+        held = await ledger.available(USER)
+        ledger.refund(reservation)
+        ledger.refund(reservation)
+        released = await ledger.available(USER)
+        with pytest.raises(ValueError):
+            ledger.commit(reservation)
+        with pytest.raises(RuntimeError):
+            async with ledger.charge(USER, 4):
+                raise RuntimeError("inference failed")
+        after_failure = await ledger.available(USER)
+        await ledger.stop()
+        return held, released, after_failure
+
+    assert asyncio.run(scenario()) == (3, 5, 5)
+    assert service.credits == 5
+    assert service.applied == set()
+
+
+def test_lost_flush_response_is_replayed_once_and_balance_reread(ledger_module, tmp_path):
+    ledger, service = make_ledger(ledger_module, tmp_path, credits=5)
+
+    async def scenario():
+        await ledger.start()
+        async with ledger.charge(USER, 5):
+            pass
+        service.lose_response = True
+        await ledger.flush()
+        # The batch is kept for a retry, and the charge still counts
+        assert len(os.listdir(tmp_path)) == 1
+        assert await ledger.available(USER) == 0
+
+        service.lose_response = False
+        reads = service.reads
+        await ledger.flush()
+        available = await ledger.available(USER)
+        assert service.reads == reads + 1
+        with pytest.raises(ledger_module.InsufficientCredits):
+            await ledger.reserve(USER, 1)
+        await ledger.stop()
+        return available
+
+    assert asyncio.run(scenario()) == 0
+    assert service.credits == 0
+    assert len(service.applied) == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_restart_replays_leftover_journal_and_batches(ledger_module, tmp_path):
+    ledger, service = make_ledger(ledger_module, tmp_path, credits=10)
+
+    async def crashed_run():
+        await ledger.start()
+        async with ledger.charge(USER, 2):
+            pass
+        # Rotate one batch out, then journal more, then die without flushing
+        ledger._rotate()
+        async with ledger.charge(USER, 3):
+            pass
+        ledger._task.cancel()
+        ledger._journal.close()
+
+    asyncio.run(crashed_run())
+    with open(tmp_path / ledger_module.JOURNAL_FILE, "a") as f:
+        f.write('{"id": "torn')
+    assert service.applied == set()
+
+    restarted = ledger_module.CreditLedger(str(tmp_path), flush_interval=3600, fsync=False)
+
+    async def restart():
+        await restarted.start()
+        # Unflushed charges from the previous process still count
+        before_flush = await restarted.available(USER)
+        await restarted.flush()
+        after_flush = await restarted.available(USER)
+        await restarted.stop()
+        return before_flush, after_flush
+
+    assert asyncio.run(restart()) == (5, 5)
+    assert service.credits == 5
+    assert len(service.applied) == 2
+    assert os.listdir(tmp_path) == []
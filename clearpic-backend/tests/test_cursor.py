@@ -0,0 +1,45 @@
+import base64
+import json
+
+import pytest
+
+from utils.cursor import decode_cursor, encode_cursor
+
+ROW = {"id": "3f058d4d-5eac-416c-aa1b-6f2c2a2df872", "created_at": "2026-10-18T10:00:02.123456+00:00"}
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+@pytest.mark.parametrize("created_at", [
+    ROW["created_at"],
+    "2026-10-18T10:00:02+00:00",
+    "2026-10-18 10:00:02.5Z",
+    "2026-10-18T10:00:02",
+])
+def test_round_trip(created_at):
+    row = {**ROW, "created_at": created_at}
+
+    cursor = encode_cursor(row)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, row["id"])
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not base64 !",
+    raw_cursor("just a string"),
+    raw_cursor([ROW["created_at"]]),
+    raw_cursor([ROW["created_at"], ROW["id"], "extra"]),
+    raw_cursor([12345, ROW["id"]]),
+    raw_cursor([ROW["created_at"], 7]),
+    raw_cursor(["yesterday", ROW["id"]]),
+    # Values that would break out of the quoted PostgREST filter
+    raw_cursor(['2026-10-18T10:00:02"),id.gt.(0', ROW["id"]]),
+    raw_cursor([ROW["created_at"], "0),or(user_id.neq.00000000-0000-00"]),
+])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
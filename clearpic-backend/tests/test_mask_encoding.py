@@ -0,0 +1,64 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from image_encoding import encode_mask
+
+
+def decode_rle(data: bytes) -> np.ndarray:
+    payload = json.loads(data)
+    values = np.zeros(len(payload["counts"]), dtype=bool)
+    values[1::2] = True
+    flat = np.repeat(values, payload["counts"])
+    return flat.reshape(payload["size"])
+
+
+def sample_mask() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    mask = rng.integers(0, 256, (37, 29), dtype=np.uint8)
+    # Long runs as well as noise
+    mask[10:20, :] = 255
+    mask[25:30, :] = 0
+    return mask
+
+
+@pytest.mark.parametrize("threshold", [1, 128, 255])
+def test_rle_round_trip(threshold):
+    mask = sample_mask()
+
+    data = encode_mask(mask, "rle", threshold)
+
+    assert json.loads(data)["threshold"] == threshold
+    assert np.array_equal(decode_rle(data), mask >= threshold)
+
+
+@pytest.mark.parametrize("fill", [0, 255])
+def test_rle_starts_with_background_run(fill):
+    mask = np.full((4, 6), fill, dtype=np.uint8)
+
+    counts = json.loads(encode_mask(mask, "rle"))["counts"]
+
+    assert counts == ([24] if fill == 0 else [0, 24])
+
+
+def test_binary_round_trip():
+    mask = sample_mask()
+
+    decoded = cv2.imdecode(np.frombuffer(encode_mask(mask, "binary", 100), np.uint8), cv2.IMREAD_GRAYSCALE)
+
+    assert np.array_equal(decoded, np.where(mask >= 100, 255, 0).astype(np.uint8))
+
+
+def test_png_round_trip_is_lossless():
+    mask = sample_mask()
+
+    decoded = cv2.imdecode(np.frombuffer(encode_mask(mask, "png"), np.uint8), cv2.IMREAD_GRAYSCALE)
+
+    assert np.array_equal(decoded, mask)
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        encode_mask(sample_mask(), "tiff")
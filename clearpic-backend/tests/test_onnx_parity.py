@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+import torch
+
+from export_onnx import export, verify_parity
+from model.u2net import U2NETP
+
+
+def test_u2netp_onnx_matches_torch(tmp_path):
+    # Random weights are enough to check the exported graph against eager
+    torch.manual_seed(0)
+    checkpoint = tmp_path / "u2netp.pth"
+    torch.save(U2NETP(3, 1).state_dict(), checkpoint)
+    output = tmp_path / "u2netp.onnx"
+
+    net = export("u2netp", str(checkpoint), str(output))
+    max_diff = verify_parity(net, str(output), batch_size=2)
+
+    assert max_diff <= 1e-4
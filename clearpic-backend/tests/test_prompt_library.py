@@ -0,0 +1,59 @@
+import json
+import os
+
+from background_generators import GradientGenerator
+from build_prompt_library import build
+from prompt_categories import PROMPT_CATEGORIES, normalize_prompt
+from services.prompt_library import INDEX_FILE, PromptLibrary
+
+
+class CountingGenerator(GradientGenerator):
+    def __init__(self, size: int = 16):
+        super().__init__(size)
+        self.calls = 0
+
+    def generate(self, prompt: str, seed: int) -> bytes:
+        self.calls += 1
+        return super().generate(prompt, seed)
+
+
+def test_build_writes_every_variant(tmp_path):
+    generator = CountingGenerator()
+    prompts = PROMPT_CATEGORIES["nature"]
+
+    index = build(generator, str(tmp_path), ["nature"], variants=2)
+
+    assert generator.calls == 2 * len(prompts)
+    assert index["model"] == GradientGenerator.model
+    with open(tmp_path / INDEX_FILE) as f:
+        assert json.load(f) == index
+    for prompt in prompts:
+        entry = index["prompts"][normalize_prompt(prompt)]
+        assert [variant["seed"] for variant in entry["variants"]] == [0, 1]
+        for variant in entry["variants"]:
+            assert os.path.exists(tmp_path / variant["file"])
+
+
+def test_rebuild_reuses_existing_files_unless_forced(tmp_path):
+    build(CountingGenerator(), str(tmp_path), ["nature"], variants=1)
+
+    reused = CountingGenerator()
+    build(reused, str(tmp_path), ["nature"], variants=1)
+    forced = CountingGenerator()
+    build(forced, str(tmp_path), ["nature"], variants=1, force=True)
+
+    assert reused.calls == 0
+    assert forced.calls == len(PROMPT_CATEGORIES["nature"])
+
+
+def test_library_serves_built_backgrounds(tmp_path):
+    generator = GradientGenerator(size=16)
+    build(generator, str(tmp_path), ["nature"], variants=2)
+    library = PromptLibrary(str(tmp_path))
+    prompt = PROMPT_CATEGORIES["nature"][0]
+
+    # Lookups are normalized the same way as the index keys
+    assert library.load(f"  {prompt.upper()} ", seed=1) == generator.generate(prompt, 1)
+    assert library.load(prompt) in (generator.generate(prompt, 0), generator.generate(prompt, 1))
+    assert library.load(prompt, seed=5) is None
+    assert library.load("a prompt that was never rendered") is None
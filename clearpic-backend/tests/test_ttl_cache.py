@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+from utils.ttl_cache import TTLCache
+
+
+def test_concurrent_misses_share_one_call():
+    cache = TTLCache()
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_set("key", factory) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["value"] * 5
+    assert len(calls) == 1
+    assert cache.get("key") == "value"
+    assert cache.stats() == {"hits": 4, "misses": 1, "entries": 1}
+
+
+def test_owner_cancellation_does_not_reach_waiters():
+    cache = TTLCache()
+
+    async def factory():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def scenario():
+        owner = asyncio.ensure_future(cache.get_or_set("key", factory))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(cache.get_or_set("key", factory))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        return owner, await waiter
+
+    owner, result = asyncio.run(scenario())
+
+    assert owner.cancelled()
+    assert result == "value"
+    assert cache.get("key") == "value"
+
+
+def test_none_and_failures_are_not_cached():
+    cache = TTLCache()
+
+    async def empty():
+        return None
+
+    async def failing():
+        raise Exception("upstream failed")
+
+    async def scenario():
+        first = await cache.get_or_set("empty", empty)
+        failures = await asyncio.gather(cache.get_or_set("failing", failing), cache.get_or_set("failing", failing), return_exceptions=True)
+        return first, failures
+
+    first, failures = asyncio.run(scenario())
+
+    assert first is None
+    assert [str(failure) for failure in failures] == ["upstream failed"] * 2
+    assert cache.get("empty") is None and cache.get("failing") is None
+    assert cache._inflight == {}
+
+
+def test_entries_expire_and_are_evicted_oldest_first():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    cache.set("short", 4, ttl_seconds=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.get("short") is None
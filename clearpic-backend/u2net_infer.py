@@ -1,33 +1,305 @@
 import sys
 sys.path.append("./U-2-Net")
 from model.u2net import U2NET
+from model.u2net_refactor import U2NET_lite
+from services.model_registry import model_registry
+from services.inference_engine import BatchingEngine
+from services.result_cache import result_cache
+from compositing import merge_alpha
+from image_encoding import encode_image, encode_mask
 import torch
 import numpy as np
 from PIL import Image
-from torchvision import transforms
+from typing import Optional
 import cv2
+import functools
 import io
+import os
+import threading
 
-def load_model(model_path='U-2-Net/saved_models/u2net/u2net.pth'):
-    net = U2NET(3, 1)
+U2NET_MODEL_PATH = os.getenv("U2NET_MODEL_PATH", "U-2-Net/saved_models/u2net/u2net.pth")
+U2NETP_MODEL_PATH = os.getenv("U2NETP_MODEL_PATH", "U-2-Net/saved_models/u2netp/u2netp.pth")
+U2NET_ONNX_PATH = os.getenv("U2NET_ONNX_PATH", os.path.splitext(U2NET_MODEL_PATH)[0] + ".onnx")
+U2NETP_ONNX_PATH = os.getenv("U2NETP_ONNX_PATH", os.path.splitext(U2NETP_MODEL_PATH)[0] + ".onnx")
+U2NET_INT8_PATH = os.getenv("U2NET_INT8_PATH", os.path.splitext(U2NET_MODEL_PATH)[0] + ".int8.pt")
+U2NETP_INT8_PATH = os.getenv("U2NETP_INT8_PATH", os.path.splitext(U2NETP_MODEL_PATH)[0] + ".int8.pt")
+
+# Execution backend for every variant: "torch" (eager) or "onnx" (ONNX Runtime, CPU)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+
+# {variant: (network factory, checkpoint path, exported ONNX path)}
+MODEL_VARIANTS = {
+    "u2net": (lambda: U2NET(3, 1), U2NET_MODEL_PATH, U2NET_ONNX_PATH),
+    # Small model: original u2netp.pth weights served by the refactored U2NET_lite
+    "u2netp": (U2NET_lite, U2NETP_MODEL_PATH, U2NETP_ONNX_PATH),
+}
+
+# Request quality tiers and the model variant serving each
+QUALITY_VARIANTS = {
+    "full": "u2net",
+    "fast": "u2netp",
+}
+
+# Default quality per subscription plan; anonymous requests use DEFAULT_QUALITY
+PLAN_DEFAULT_QUALITY = {
+    "free": "fast",
+    "basic": "full",
+    "premium": "full",
+}
+DEFAULT_QUALITY = os.getenv("DEFAULT_QUALITY", "full")
+
+# INT8 checkpoints produced by quantize_model.py, and the quality tiers that
+# serve them instead of FP32 (torch backend only)
+INT8_PATHS = {
+    "u2net": U2NET_INT8_PATH,
+    "u2netp": U2NETP_INT8_PATH,
+}
+QUANTIZED_TIERS = [t.strip() for t in os.getenv("QUANTIZED_TIERS", "").split(",") if t.strip()]
+QUANTIZED_VARIANTS = {QUALITY_VARIANTS[t] for t in QUANTIZED_TIERS if t in QUALITY_VARIANTS}
+
+# Loaded at startup and required by /health/ready. u2netp.pth is optional, so
+# only the full model is by default; add u2netp where its checkpoint ships
+PRELOAD_VARIANTS = [v.strip() for v in os.getenv("U2NET_PRELOAD_VARIANTS", "u2net").split(",") if v.strip()]
+
+def load_checkpoint(net, model_path):
+    """Load an original U-2-Net checkpoint into `net`, which may be either the
+    original or the refactored module tree."""
+    state_dict = torch.load(model_path, map_location='cpu')
+    if isinstance(state_dict, dict) and "state_dict" in state_dict:
+        state_dict = state_dict["state_dict"]
+
+    # Checkpoints trained under DataParallel prefix every key with "module."
+    state_dict = {k[len("module."):] if k.startswith("module.") else k: v for k, v in state_dict.items()}
+
+    # Both module trees name their parameters stageN.rebnconvX.{conv_s1,bn_s1},
+    # sideN and outconv, so keys line up one to one; verify that explicitly so a
+    # mismatched checkpoint/variant pair fails loudly instead of half-loading
+    target = net.state_dict()
+    missing = [k for k in target if k not in state_dict]
+    unexpected = [k for k in state_dict if k not in target]
+    mismatched = [k for k in target if k in state_dict and state_dict[k].shape != target[k].shape]
+    if missing or unexpected or mismatched:
+        raise Exception(
+            f"Checkpoint {model_path} does not match {type(net).__name__}: "
+            f"{len(missing)} missing, {len(unexpected)} unexpected, {len(mismatched)} mismatched keys"
+        )
+
+    net.load_state_dict(state_dict)
+    return net
+
+def load_model(model_path=U2NET_MODEL_PATH, variant="u2net"):
+    if model_path.endswith(".pt"):
+        # TorchScript INT8 model from quantize_model.py; quantized kernels are CPU-only
+        net = torch.jit.load(model_path, map_location='cpu')
+        net.eval()
+        return net
+
+    build = MODEL_VARIANTS[variant][0]
+    net = load_checkpoint(build(), model_path)
     if torch.cuda.is_available():
-        net.load_state_dict(torch.load(model_path))
         net.cuda()
-    else:
-        net.load_state_dict(torch.load(model_path, map_location='cpu'))
     net.eval()
     return net
 
+class TorchBackend:
+    """Eager PyTorch execution of a loaded U2NET module."""
+
+    def __init__(self, net):
+        self.net = net
+        # Quantized TorchScript modules expose no float parameters and run on CPU
+        parameter = next(net.parameters(), None)
+        self.device = parameter.device if parameter is not None else torch.device('cpu')
+
+    def run(self, inputs):
+        # inputs: Nx3x320x320 float tensor; returns the Nx1x320x320 d1 map on CPU
+        with torch.no_grad():
+            d1, *_ = self.net(inputs.to(self.device))
+        return d1.cpu()
+
+class OnnxRuntimeBackend:
+    """Runs a graph exported by export_onnx.py on ONNX Runtime's CPU provider."""
+
+    def __init__(self, model_path, intra_op_threads=0):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise Exception("INFERENCE_BACKEND=onnx requires the onnxruntime package")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    def run(self, inputs):
+        outputs = self.session.run([self.output_name], {self.input_name: inputs.cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+def load_backend(variant="u2net", backend=INFERENCE_BACKEND):
+    _, model_path, onnx_path = MODEL_VARIANTS[variant]
+    if backend == "torch":
+        if variant in QUANTIZED_VARIANTS:
+            model_path = INT8_PATHS[variant]
+        return TorchBackend(load_model(model_path, variant))
+    if backend == "onnx":
+        return OnnxRuntimeBackend(onnx_path, intra_op_threads=int(os.getenv("ONNX_INTRA_OP_THREADS", "0")))
+    raise ValueError(f"Unknown inference backend '{backend}'. Expected 'torch' or 'onnx'")
+
+def warmup_backend(backend, runs: int = 2):
+    # Synthetic forward passes to prime the allocator and intra-op thread pools
+    inputs = torch.zeros(1, 3, 320, 320)
+    for _ in range(runs):
+        backend.run(inputs)
+
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+
+# One preallocated Nx3x320x320 input batch per variant; each engine has a
+# single worker thread, so its buffer is never written concurrently
+_batch_buffers = {}
+
+def run_u2net_batch(variant, tensors):
+    # Stack N preprocessed 3x320x320 tensors into one forward pass and
+    # hand each caller back its own d1 slice
+    backend = model_registry.get(variant)
+    buffer = _batch_buffers.get(variant)
+    if buffer is None or buffer.shape[0] < len(tensors):
+        buffer = _batch_buffers[variant] = torch.empty(max(MAX_BATCH_SIZE, len(tensors)), 3, 320, 320)
+    inputs = buffer[:len(tensors)]
+    torch.stack(tensors, out=inputs)
+    d1 = backend.run(inputs)
+    return list(d1)
+
+engines = {}
+for _variant in MODEL_VARIANTS:
+    model_registry.register(_variant, functools.partial(load_backend, _variant), warmup=warmup_backend)
+    engines[_variant] = BatchingEngine(
+        functools.partial(run_u2net_batch, _variant),
+        max_batch_size=MAX_BATCH_SIZE,
+        max_wait_ms=float(os.getenv("INFERENCE_MAX_WAIT_MS", "10")),
+        name=_variant,
+    )
+
+def resolve_quality(quality: Optional[str] = None, plan: Optional[str] = None) -> str:
+    if quality:
+        quality = quality.lower()
+        if quality not in QUALITY_VARIANTS:
+            raise ValueError(f"Invalid quality '{quality}'. Expected one of: {', '.join(QUALITY_VARIANTS)}")
+        return quality
+    return PLAN_DEFAULT_QUALITY.get(plan, DEFAULT_QUALITY)
+
+def decode_image(image_data: bytes):
+    # Decode upload bytes straight from memory (BGR, like cv2.imread)
+    nparr = np.frombuffer(image_data, np.uint8)
+    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if image is None:
+        raise Exception("Failed to decode input image")
+    return image
+
+def decode_with_alpha(image_data: bytes):
+    """Decode an upload to (BGR image, alpha or None). Alpha is returned only
+    when the upload has a channel that is actually transparent somewhere,
+    e.g. a cut-out PNG from /remove-bg; other uploads decode as decode_image."""
+    try:
+        header = Image.open(io.BytesIO(image_data))
+        transparent = header.mode in ("RGBA", "LA", "PA") or "transparency" in header.info
+    except Exception:
+        transparent = False
+    if not transparent:
+        return decode_image(image_data), None
+
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise Exception("Failed to decode input image")
+    if image.dtype != np.uint8:
+        image = (image >> 8).astype(np.uint8)
+    if image.ndim != 3 or image.shape[2] != 4:
+        return decode_image(image_data), None
+    alpha = np.ascontiguousarray(image[:, :, 3])
+    if alpha.min() == 255:
+        # Fully opaque; the subject still has to be segmented
+        return np.ascontiguousarray(image[:, :, :3]), None
+    return np.ascontiguousarray(image[:, :, :3]), alpha
+
+# cv2 flags that let the JPEG decoder skip DCT detail at 1/2, 1/4 or 1/8 scale
+REDUCED_DECODE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def reduced_decode_factor(image_data: bytes, target: int = 320) -> int:
+    # Largest downscale that still leaves both sides >= the network input size;
+    # Image.open only parses the header here. Only the JPEG decoder really
+    # decodes at reduced scale; for other formats OpenCV decodes in full and
+    # resizes, which is slower than resizing a frame we already have
+    try:
+        header = Image.open(io.BytesIO(image_data))
+    except Exception:
+        return 1
+    if header.format != "JPEG":
+        return 1
+    width, height = header.size
+    for factor in (8, 4, 2):
+        if min(width, height) >= target * factor:
+            return factor
+    return 1
+
+def source_size(image_data: bytes):
+    # (width, height) of the upload as cv2.imdecode would orient it, read
+    # from the header without decoding pixels
+    image = Image.open(io.BytesIO(image_data))
+    width, height = image.size
+    # EXIF orientations 5-8 rotate by 90 degrees
+    if image.getexif().get(0x0112) in (5, 6, 7, 8):
+        width, height = height, width
+    return width, height
+
+def decode_for_inference(image_data: bytes, image=None):
+    """Decode only as much resolution as the 320x320 network input needs.
+    `image` is an already decoded full-resolution frame to fall back on."""
+    factor = reduced_decode_factor(image_data)
+    if factor > 1:
+        reduced = cv2.imdecode(np.frombuffer(image_data, np.uint8), REDUCED_DECODE_FLAGS[factor])
+        if reduced is not None:
+            return reduced
+    return image if image is not None else decode_image(image_data)
+
+# ImageNet normalization folded into one per-channel scale and shift applied
+# to raw uint8 pixels: (x / 255 - mean) / std == x * scale + shift
+_NORM_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_NORM_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+_NORM_SCALE = (1.0 / (255.0 * _NORM_STD)).reshape(3, 1, 1)
+_NORM_SHIFT = (-_NORM_MEAN / _NORM_STD).reshape(3, 1, 1)
+
+_thread_buffers = threading.local()
+
+def _input_buffer():
+    # Per-thread reusable 3x320x320 input; safe because the calling thread
+    # blocks on its inference result before preprocessing the next image
+    buffer = getattr(_thread_buffers, "input", None)
+    if buffer is None:
+        buffer = _thread_buffers.input = np.empty((3, 320, 320), dtype=np.float32)
+    return buffer
+
+def to_input_tensor(image, out=None):
+    """BGR uint8 array -> normalized 3x320x320 float32 network input.
+
+    Resizes in uint8 first, then normalizes, swaps BGR->RGB and transposes to
+    CHW in a single pass into `out` (a new array if not given)."""
+    interpolation = cv2.INTER_AREA if image.shape[0] > 320 or image.shape[1] > 320 else cv2.INTER_LINEAR
+    resized = cv2.resize(image, (320, 320), interpolation=interpolation)
+    if out is None:
+        out = np.empty((3, 320, 320), dtype=np.float32)
+    chw = resized[:, :, ::-1].transpose(2, 0, 1)
+    np.multiply(chw, _NORM_SCALE, out=out)
+    np.add(out, _NORM_SHIFT, out=out)
+    return torch.from_numpy(out)
+
 def preprocess_image(image_data):
-    # Convert bytes to PIL Image
-    image = Image.open(io.BytesIO(image_data)).convert('RGB')
-    transform = transforms.Compose([
-        transforms.Resize((320, 320)),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406],
-                           [0.229, 0.224, 0.225])
-    ])
-    return image, transform(image)
+    # Decode once; the full-resolution BGR image is reused by apply_mask
+    image = decode_image(image_data)
+    return image, to_input_tensor(image)
 
 def postprocess_mask(mask):
     mask = mask.squeeze().cpu().data.numpy()
@@ -35,64 +307,47 @@ def postprocess_mask(mask):
     mask = (mask * 255).astype(np.uint8)
     return mask
 
-def apply_mask(image_data, mask):
-    # Convert bytes to numpy array
-    nparr = np.frombuffer(image_data, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    
+def apply_mask(image, mask, output_format="png", encode_params=None):
+    # Resize mask to the original image size and use it as the alpha channel
     mask = cv2.resize(mask, (image.shape[1], image.shape[0]))
-    alpha = mask.astype(float) / 255
-    b, g, r = cv2.split(image)
-    rgba = [b, g, r, (alpha * 255).astype(np.uint8)]
-    result = cv2.merge(rgba, 4)
-    
+    result = merge_alpha(image, mask)
+
     # Convert result to bytes
-    _, buffer = cv2.imencode('.png', result)
-    return buffer.tobytes()
+    return encode_image(result, output_format, encode_params)
+
+def predict_mask(image, variant: str):
+    # Batched with any concurrent requests for the same model variant
+    d1 = engines[variant].infer(to_input_tensor(image, out=_input_buffer()))
+    return postprocess_mask(d1[0])
+
+def compute_mask(image_data: bytes, quality: str = "full", image=None):
+    """Return the 320x320 uint8 matte for an upload, from the result cache when
+    the same bytes were already processed with the same model settings."""
+    variant = QUALITY_VARIANTS[quality]
+    key = result_cache.make_key(image_data, variant, INFERENCE_BACKEND, variant in QUANTIZED_VARIANTS)
 
-def remove_background(image_path: str) -> str:
+    def compute():
+        return predict_mask(decode_for_inference(image_data, image), variant).tobytes()
+
+    mask = result_cache.get_or_compute(key, compute)
+    return np.frombuffer(mask, np.uint8).reshape(320, 320)
+
+def extract_mask(image_data: bytes, quality: str = "full", resolution: str = "native", mask_format: str = "png", threshold: int = 128) -> bytes:
+    """Matte only: `native` returns the 320x320 network output, `source`
+    resizes it to the upload's dimensions."""
+    try:
+        mask = compute_mask(image_data, quality)
+        if resolution == "source":
+            mask = cv2.resize(mask, source_size(image_data), interpolation=cv2.INTER_LINEAR)
+        return encode_mask(mask, mask_format, threshold)
+    except Exception as e:
+        raise Exception(f"Failed to extract mask: {str(e)}")
+
+def remove_background(image_data: bytes, quality: str = "full", output_format: str = "png", encode_params=None) -> bytes:
     try:
-        net = load_model()
-        
-        # Read the image
-        image = cv2.imread(image_path)
-        if image is None:
-            raise Exception("Failed to read input image")
-            
-        # Preprocess the image
-        transform = transforms.Compose([
-            transforms.ToTensor(),
-            transforms.Resize((320, 320)),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
-        
-        # Convert BGR to RGB
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        image_tensor = transform(Image.fromarray(image_rgb))
-        
-        if torch.cuda.is_available():
-            inputs = image_tensor.unsqueeze(0).cuda()
-        else:
-            inputs = image_tensor.unsqueeze(0)
+        image = decode_image(image_data)
+        mask = compute_mask(image_data, quality, image)
+        return apply_mask(image, mask, output_format, encode_params)
 
-        with torch.no_grad():
-            d1, *_ = net(inputs)
-            mask = d1[:, 0, :, :]
-            mask = postprocess_mask(mask)
-            
-            # Resize mask to original image size
-            mask = cv2.resize(mask, (image.shape[1], image.shape[0]))
-            
-            # Create alpha channel
-            alpha = mask.astype(float) / 255
-            b, g, r = cv2.split(image)
-            rgba = [b, g, r, (alpha * 255).astype(np.uint8)]
-            result = cv2.merge(rgba)
-            
-            # Save the result
-            result_path = "result_removed_bg.png"
-            cv2.imwrite(result_path, result)
-            return result_path
-            
     except Exception as e:
         raise Exception(f"Failed to remove background: {str(e)}")
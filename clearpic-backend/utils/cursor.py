@@ -0,0 +1,27 @@
+import base64
+import json
+import re
+from typing import Tuple
+
+# Timestamps as PostgREST returns them, and UUIDs
+CURSOR_TIMESTAMP = re.compile(r"^\d{4}-\d{2}-\d{2}[T ][\d:.]+([+-]\d{2}(:?\d{2})?|Z)?$")
+CURSOR_ID = re.compile(r"^[0-9a-fA-F-]{36}$")
+
+
+def encode_cursor(row: dict) -> str:
+    # Opaque to clients: the (created_at, id) of the last row returned
+    raw = json.dumps([row["created_at"], row["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_cursor. Raises ValueError for anything it did not
+    produce, since the values end up inside a PostgREST filter."""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(row_id, str) \
+            or not CURSOR_TIMESTAMP.match(created_at) or not CURSOR_ID.match(row_id):
+        raise ValueError("Invalid cursor")
+    return created_at, row_id